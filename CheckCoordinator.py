@@ -0,0 +1,56 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+class CheckCoordinator:
+    """
+    Odczytuje z bazy danych obiekty kontrolowanych warstw równolegle,
+    konflikty rozstrzygane są w wątku głównym
+    """
+
+    def __init__(self, getMaxWorkers, onError=None):
+        # read at every run, the executor is created again when it changes
+        self.getMaxWorkers = getMaxWorkers
+        self.onError = onError
+        self.executor = None
+        self.executorWorkers = None
+
+    def getExecutor(self, maxWorkers):
+        if (self.executor is not None and self.executorWorkers != maxWorkers):
+            self.shutdown()
+        if (self.executor is None):
+            self.executor = ThreadPoolExecutor(
+                max_workers=maxWorkers, thread_name_prefix='EditionReloaderCheck')
+            self.executorWorkers = maxWorkers
+        return self.executor
+
+    def run(self, checks):
+        # checks: [(read, resolve)], read runs in a worker thread,
+        # resolve(result of read) in the calling thread in the order of checks
+        if (len(checks) == 0):
+            return
+        maxWorkers = self.getMaxWorkers()
+        if (len(checks) == 1 or maxWorkers <= 1):
+            results = [self.read(read) for read, resolve in checks]
+        else:
+            executor = self.getExecutor(maxWorkers)
+            futures = [executor.submit(self.read, read)
+                       for read, resolve in checks]
+            results = [future.result() for future in futures]
+        for (read, resolve), (isRead, result) in zip(checks, results):
+            if (isRead):
+                resolve(result)
+            elif (self.onError is not None):
+                # reported in the calling thread, a failed read is not resolved
+                self.onError(result)
+
+    def read(self, read):
+        # returns (True, result of read) or (False, exception)
+        try:
+            return (True, read())
+        except Exception as ex:
+            return (False, ex)
+
+    def shutdown(self):
+        if (self.executor is not None):
+            self.executor.shutdown(wait=False)
+            self.executor = None
@@ -0,0 +1,74 @@
+from qgis.PyQt.QtCore import QTimer
+import time
+
+
+class CheckScheduler:
+    """
+    Łączy kontrole warstw wywoływane przez renderowanie mapy
+    w jedną kontrolę na zadany interwał
+    """
+
+    def __init__(self, getInterval, isBusy=None, runChecks=None, onSkipped=None):
+        # interval in ms, read at every check, so it can be changed any time
+        self.getInterval = getInterval
+        self.isBusy = isBusy
+        # with runChecks the callbacks return checks, which are run together
+        self.runChecks = runChecks
+        # called for a pending check which is not required any more
+        self.onSkipped = onSkipped
+        self.pending = {}
+        self.lastChecks = {}
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self._onTimeout)
+
+    def schedule(self, key, callback, isRequired=None):
+        # renders arriving while the timer runs join the pending check,
+        # the timer is not restarted, so continuous rendering can not postpone it
+        self.pending[key] = (callback, isRequired)
+        if (not self.timer.isActive()):
+            self.timer.start(self.getInterval())
+
+    def cancel(self, key):
+        self.pending.pop(key, None)
+        self.lastChecks.pop(key, None)
+
+    def stop(self):
+        self.timer.stop()
+        self.pending.clear()
+        self.lastChecks.clear()
+
+    def getRemainingTime(self, key, now):
+        elapsed = (now - self.lastChecks.get(key, 0)) * 1000
+        return max(0, int(self.getInterval() - elapsed))
+
+    def _onTimeout(self):
+        if (self.isBusy is not None and self.isBusy()):
+            self.timer.start(self.getInterval())
+            return
+        now = time.monotonic()
+        pending = self.pending
+        self.pending = {}
+        remainingTimes = []
+        checks = []
+        for key, (callback, isRequired) in pending.items():
+            remainingTime = self.getRemainingTime(key, now)
+            if (remainingTime > 0):
+                self.pending[key] = (callback, isRequired)
+                remainingTimes.append(remainingTime)
+                continue
+            if (isRequired is not None and not isRequired()):
+                if (self.onSkipped is not None):
+                    self.onSkipped()
+                continue
+            self.lastChecks[key] = now
+            if (self.runChecks is None):
+                callback()
+                continue
+            check = callback()
+            if (check is not None):
+                checks.append(check)
+        if (len(checks) > 0):
+            self.runChecks(checks)
+        if (len(remainingTimes) > 0):
+            self.timer.start(min(remainingTimes))
@@ -2,9 +2,22 @@ from qgis.core import QgsProject
 from qgis.core import Qgis, QgsField
 from qgis.PyQt.QtCore import QVariant
 from qgis.core import QgsVectorLayer, QgsWkbTypes, QgsFeatureRequest, QgsVectorLayerEditBuffer, QgsFeature, QgsMapLayer
-from shapely import wkt
+from qgis.core import QgsDataSourceUri, QgsApplication, QgsSimplifyMethod, QgsGeometry
+import hashlib
 import pprint
 from . import dictionaries
+from . import comparators
+from . import differences
+from .CheckCoordinator import CheckCoordinator
+from .CheckScheduler import CheckScheduler
+from .Instrumentation import Instrumentation
+from .ListenerRegistry import ListenerRegistry
+from . import NotificationListener
+from . import ProviderAdapters
+from . import ReadConnectionPool
+from .SnapshotCache import SnapshotCache
+from .SnapshotStore import DigestSnapshot, GeometrySnapshot, LayerSnapshot, TileCoverage, WkbSnapshot
+from .SnapshotTask import SnapshotTask
 
 
 def singleton(class_):
@@ -28,16 +41,92 @@ class EditionResolver:
     def __init__(self, iface):
         self.iface = iface
         self.layers = {}
-        self.listeners = []
+        self.featureVersions = {}
+        self.changeTokens = {}
+        # {layer: {featureId: (snapshot geometry, database geometry)}} of the last check,
+        # their differences are added when the conflicts are rolled back
+        self.conflictGeometries = {}
+        self.snapshotTasks = {}
+        self.snapshotCoverages = {}
+        self.backupLayers = {}
+        # {layer: {featureId: backup layer featureId}}
+        self.backupFeatureIds = {}
+        self.notificationListeners = {}
+        # {connection info: read connection pool}
+        self.readPools = {}
+        # Number of checks run against the data provider
+        self.checkCount = 0
+        self._isChecking = False
+        # Layers repainted by the resolver itself, their next render does not trigger a check
+        self._ownRenderLayers = set()
+        self.listeners = ListenerRegistry(
+            lambda ex, listener: self.dprint(('disconnect Exception', ex, listener)))
         self.activeLayer = None
         self._debug = False  # True | False
+        # 'full' copies the whole layer when editing starts,
+        # 'lazy' copies a feature when its geometry is changed for the first time,
+        # a change made in the database between the start of editing and that edit
+        # is detected only with _versionColumn (versions are read when editing starts),
+        # 'extent' copies features visible on the map and grows with the map extent
+        self._snapshotMode = 'full'  # 'full' | 'lazy' | 'extent'
+        # Tile size of the 'extent' snapshot in layer units, None = 1/32 of the layer extent
+        self._snapshotTileSize = None
+        # 'layer' keeps a memory layer copy, 'geometry' a dictionary of geometries,
+        # 'digest' only a hash of each geometry (full geometry of edited features),
+        # 'wkb' the geometries as WKB in a single buffer
+        self._snapshotStorage = 'layer'  # 'layer' | 'geometry' | 'digest' | 'wkb'
+        # Build the full snapshot in a background task ('geometry', 'digest' or 'wkb' storage)
+        self._snapshotAsync = False  # True | False
+        # Max number of feature ids sent to the data provider in a single request
+        self._fetchChunkSize = 1000
+        # Number of features added to the memory layer snapshot at once
+        self._snapshotChunkSize = 10000
+        # SQLite file keeping the full snapshot between edit sessions, None = disabled,
+        # used only with version tracking, e.g.
+        # os.path.join(QgsApplication.qgisSettingsDirPath(), 'editionreloader.sqlite')
+        self._snapshotCachePath = None
+        # Row version compared before downloading geometries,
+        # 'xmin' uses the PostgreSQL system column
+        self._versionColumn = None  # None | 'xmin' | column name
+        # Geometries compared after simplification by the data provider (layer units),
+        # conflicting features are downloaded again without simplification
+        self._compareSimplifyTolerance = None
+        # Coordinates differing less than the tolerance are equal (layer units)
+        self._compareTolerance = None
+        # Add the differences of conflicting features to a 'diff_' layer
+        self._differenceLayer = False  # True | False
+        # Min time between two checks of a layer triggered by rendering (ms)
+        self._checkInterval = 500
+        # Max number of layers read from the database at once by the checks
+        # triggered by one render, 1 = one layer after another
+        self._checkWorkers = 4
+        # Dedicated read-only connections of PostgreSQL layers used by checks and versions
+        # (without _compareSimplifyTolerance), 0 = read through the data provider of the layer
+        self._readPoolSize = 0
+        # Max time of a single statement of the read connections (ms)
+        self._readStatementTimeout = 5000
+        # Check features notified by a PostgreSQL trigger (LISTEN/NOTIFY)
+        # instead of checking on every render
+        self._pushMode = False  # True | False
+        # Create the notifying trigger on the table if it does not exist
+        self._pushInstallTrigger = False  # True | False
+        # Time snapshots, checks, rollbacks and backups and count data provider reads,
+        # the report is written to the QGIS log when editing stops
+        self._instrumentation = False  # True | False
+        self.instrumentation = Instrumentation(lambda: self._instrumentation)
         # Prevent looped reloading of data
         self._isQgisOldVersion = self.checkifOldQgisVersion()
+        self.checkCoordinator = CheckCoordinator(
+            lambda: self._checkWorkers, self.showCheckFailedMessage)
+        self.checkScheduler = CheckScheduler(
+            lambda: self._checkInterval, self.iface.mapCanvas().isDrawing, self.runChecks,
+            lambda: self.instrumentation.count('checksSkipped'))
 
         self.checkQgisVersion()
         self.getLayers()
         self._onNewLayerAdded()
         self._onCurrentLayerChanged()
+        self._onMapCanvasRefreshed()
         self._onReadProject()
         # self._onLayerRemoved()
 
@@ -45,41 +134,40 @@ class EditionResolver:
         self.delete()
 
     def delete(self):
-        for object, signal, callback in self.listeners:
-            self.dprint(('delete', signal, callback))
-            try:
-                signal.disconnect(callback)
-            except Exception as ex:
-                self.dprint(('delete Exception signal.disconnect',
-                             ex, object, signal, callback))
+        self.checkScheduler.stop()
+        self.checkCoordinator.shutdown()
+        for pool in self.readPools.values():
+            if (pool is not None):
+                pool.close()
+        self.readPools.clear()
+        for layer in list(self.notificationListeners.keys()):
+            self.stopNotificationListener(layer)
+        self.listeners.clear()
         try:
             del self.layers
         except Exception as ex:
             self.dprint(('delete Exception: Could not del self.layers', ex))
 
-    def addListener(self, object, signal, callback):
-        signal.connect(callback)
-        self.listeners.append((object, signal, callback))
+    def getListenerOwner(self, object):
+        # listeners of map layers are grouped by layer id
+        if (self.isTypeOfMapLayer(object)):
+            return object.id()
+        return id(object)
 
-    def removeSingleListener(self, object, signal, callback):
+    def addListener(self, object, signal, callback, layerId=None):
+        if (layerId is None):
+            layerId = self.getListenerOwner(object)
+        if (not self.listeners.add(layerId, object, signal, callback)):
+            self.dprint(('addListener: already connected', layerId, signal))
+
+    def removeSingleListener(self, object, signal, callback, layerId=None):
         self.dprint(('removeSingleListener', signal))
+        if (layerId is None):
+            layerId = self.getListenerOwner(object)
+        self.listeners.remove(layerId, signal, callback)
 
-        def tryToDisconnectSignal():
-            try:
-                signal.disconnect(callback)
-            except Exception as ex:
-                self.dprint((ex, object, signal, callback))
-
-        def removeListenerFromStack():
-            for _object, _signal, _callback in self.listeners:
-                # self.dprint(
-                #     ('removeListenerFromStack:', _signal, signal, _signal == signal, _callback, callback, _callback == callback, _object, object, _object == object))
-                if (_object == object and _signal.__repr__() == signal.__repr__() and _callback == callback):
-                    self.dprint(
-                        ('Removing Listener:', _object, _signal, _callback))
-                    self.listeners.remove((_object, _signal, _callback))
-        tryToDisconnectSignal()
-        removeListenerFromStack()
+    def getListenerCount(self):
+        return self.listeners.count()
 
     # methods
 
@@ -97,6 +185,12 @@ class EditionResolver:
         self.dprint('deleteTemporaryLayer')
         del self.layers[layer]
         self.layers[layer] = None
+        self.featureVersions.pop(layer, None)
+        self.changeTokens.pop(layer, None)
+        self.conflictGeometries.pop(layer, None)
+        self.snapshotCoverages.pop(layer, None)
+        self._ownRenderLayers.discard(layer)
+        self.cancelSnapshotTask(layer)
 
     def deleteTemporaryLayerByLayerId(self, layerId):
         for layer in self.layers.keys():
@@ -104,6 +198,222 @@ class EditionResolver:
                 del self.layers[layer]
                 self.layers[layer] = None
 
+    def createSnapshot(self, layer):
+        self.changeTokens[layer] = self.getChangeToken(layer)
+        if (self._snapshotMode == 'lazy'):
+            # versions of the features as rendered when editing starts
+            self.featureVersions[layer] = self.getInitialFeatureVersions(layer)
+            self.showInfoMessage(
+                dictionaries.temporary_control_layer_created(layer), dictionaries.edition_actived)
+            return self.createSnapshotStore()
+        if (self._snapshotMode == 'extent'):
+            return self.createExtentSnapshot(layer)
+        if (self._snapshotAsync and self._snapshotCachePath is None):
+            # versions are read by the background task as well
+            return self.createSnapshotInBackground(layer, True)
+        # versions are read before geometries, so a row changed in between
+        # is compared by geometry at the next check
+        self.featureVersions[layer] = self.getInitialFeatureVersions(layer)
+        if (self._snapshotCachePath is not None and len(self.featureVersions[layer]) > 0):
+            snapshot = self.createCachedSnapshot(layer)
+            if (snapshot is not None):
+                self.showInfoMessage(
+                    dictionaries.temporary_control_layer_created(layer), dictionaries.edition_actived)
+                return snapshot
+        if (self._snapshotAsync):
+            return self.createSnapshotInBackground(layer)
+        if (self._snapshotStorage == 'layer'):
+            tempLayer, featureIds = self.createTemporaryLayer(layer)
+            return LayerSnapshot(tempLayer, featureIds)
+        snapshot = self.createSnapshotStore()
+        snapshot.setGeometries((feature.id(), feature.geometry())
+                               for feature in self.getLayerFeatures(layer))
+        self.instrumentation.count('featuresFetched', snapshot.featureCount())
+        self.dprint(('createSnapshot feature count: ', snapshot.featureCount()))
+        self.showInfoMessage(
+            dictionaries.temporary_control_layer_created(layer), dictionaries.edition_actived)
+        return snapshot
+
+    def getSnapshotCacheKey(self, layer):
+        # geometries simplified by the data provider are cached separately
+        source = '{}|{}|{}'.format(layer.dataProvider().name(), layer.source(), self._compareSimplifyTolerance)
+        return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+    def createCachedSnapshot(self, layer):
+        # only features with a changed version are read from the data provider,
+        # the others come from the previous edit session ('layer' storage is kept as geometries)
+        versions = self.featureVersions[layer]
+        source = self.getSnapshotCacheKey(layer)
+        snapshot = self.createSnapshotStore()
+        try:
+            cache = SnapshotCache(self._snapshotCachePath)
+        except Exception as ex:
+            self.dprint(('createCachedSnapshot', ex))
+            return None
+        try:
+            cachedVersions = cache.getVersions(source)
+            changedFeatureIds = set(featureId for featureId, version in versions.items()
+                                    if cachedVersions.get(featureId) != str(version))
+            snapshot.setGeometries((featureId, self.createGeometryFromWkb(geometryWkb))
+                                   for featureId, geometryWkb in cache.getGeometries(source)
+                                   if featureId in versions and featureId not in changedFeatureIds)
+            if (len(changedFeatureIds) * 2 > len(versions)):
+                # cold or invalidated cache, one scan instead of lists of feature ids
+                features = {feature.id(): feature for feature in self.getLayerFeatures(layer)
+                            if feature.id() in changedFeatureIds}
+                self.instrumentation.count('featuresFetched', len(features))
+            else:
+                features = self.getLayerFeaturesByIds(layer, changedFeatureIds)
+            snapshot.setGeometries((featureId, feature.geometry())
+                                   for featureId, feature in features.items())
+            cache.setFeatures(source, ((featureId, str(versions[featureId]), bytes(feature.geometry().asWkb()))
+                                       for featureId, feature in features.items()))
+            cache.removeFeatures(source, [featureId for featureId in cachedVersions
+                                          if featureId not in versions])
+        except Exception as ex:
+            self.dprint(('createCachedSnapshot', ex))
+            return None
+        finally:
+            cache.close()
+        self.dprint(('createCachedSnapshot feature count: ', snapshot.featureCount(),
+                     'read from data provider: ', len(features)))
+        return snapshot
+
+    def createExtentSnapshot(self, layer):
+        # the subset string of the layer is applied by the data provider,
+        # features outside of the extent are captured on edit
+        self.featureVersions[layer] = {}
+        self.snapshotCoverages[layer] = TileCoverage(
+            self.getSnapshotTileSize(layer))
+        snapshot = self.createSnapshotStore()
+        self.extendSnapshot(layer, snapshot, self.getCanvasExtent(layer))
+        self.extendSnapshotByFeatureIds(
+            layer, snapshot, layer.selectedFeatureIds())
+        self.showInfoMessage(
+            dictionaries.temporary_control_layer_created(layer), dictionaries.edition_actived)
+        return snapshot
+
+    def getSnapshotTileSize(self, layer):
+        if (self._snapshotTileSize is not None):
+            return self._snapshotTileSize
+        extent = layer.extent()
+        tileSize = max(extent.width(), extent.height()) / 32
+        return tileSize if tileSize > 0 else 1000
+
+    def getCanvasExtent(self, layer):
+        canvas = self.iface.mapCanvas()
+        return canvas.mapSettings().mapToLayerCoordinates(layer, canvas.extent())
+
+    def extendSnapshot(self, layer, snapshot, extent):
+        # versions of these features are not known, so their geometries
+        # are compared at the first check
+        coverage = self.snapshotCoverages.get(layer)
+        extent = extent.intersect(layer.extent())
+        if (coverage is None or extent.isEmpty()):
+            return
+        tiles = coverage.getMissingTiles(extent)
+        if (len(tiles) == 0):
+            return
+        # features crossing the border of covered tiles are read again, but not replaced
+        for tilesExtent in coverage.getTilesExtents(tiles):
+            freq = self.createFeatureRequest(layer)
+            freq.setFilterRect(tilesExtent)
+            self.instrumentation.count('requests')
+            snapshot.setGeometries(((feature.id(), feature.geometry())
+                                    for feature in self.getProviderAdapter(layer).getFeatures(layer, freq)), True)
+        for tile in tiles:
+            coverage.addTile(tile)
+        self.dprint(('extendSnapshot feature count: ', snapshot.featureCount()))
+
+    def extendSnapshotByFeatureIds(self, layer, snapshot, featureIds):
+        featureIds = [featureId for featureId in featureIds
+                      if featureId >= 0 and not snapshot.hasFeature(featureId)]
+        snapshot.setGeometries((featureId, feature.geometry())
+                               for featureId, feature in self.getLayerFeaturesByIds(layer, featureIds).items())
+
+    def createSnapshotInBackground(self, layer, readVersions=False):
+        # features edited before the task finishes are captured on edit
+        # and take precedence over the ones read by the task
+        snapshot = self.createSnapshotStore()
+        featureSource = self.getProviderAdapter(layer).createFeatureSource(layer)
+        versionReader = None
+        if (readVersions):
+            self.featureVersions[layer] = {}
+            versionReader = self.createVersionReader(layer, featureSource.getFeatures, False)
+
+        def _onTaskFinished(task, result):
+            # a task canceled by a restart of editing leaves the new task in place
+            if (self.snapshotTasks.get(layer) is task):
+                del self.snapshotTasks[layer]
+            if (self.layers.get(layer) is not snapshot):
+                return
+            if (result):
+                # the store of the task becomes the snapshot of the layer,
+                # only features captured while it was running are copied into it
+                task.snapshot.update(snapshot)
+                self.layers[layer] = task.snapshot
+                if (versionReader is not None):
+                    task.versions.update(self.featureVersions[layer])
+                    self.featureVersions[layer] = task.versions
+                self.dprint(('createSnapshotInBackground feature count: ',
+                             task.snapshot.featureCount()))
+                self.showInfoMessage(
+                    dictionaries.temporary_control_layer_created(layer), dictionaries.edition_actived)
+            elif (not task.isCanceled()):
+                self.dprint(('createSnapshotInBackground', task.exception))
+                self.showWarningMessage(dictionaries.snapshot_task_failed(layer))
+
+        task = SnapshotTask(dictionaries.snapshot_task_description(layer),
+                            featureSource, layer.dataProvider().featureCount(),
+                            self.createFeatureRequest(layer), self.createSnapshotStore(), _onTaskFinished,
+                            versionReader)
+        self.snapshotTasks[layer] = task
+        QgsApplication.taskManager().addTask(task)
+        return snapshot
+
+    def cancelSnapshotTask(self, layer):
+        task = self.snapshotTasks.pop(layer, None)
+        if (task is not None):
+            task.cancel()
+
+    def createSnapshotStore(self):
+        if (self._snapshotStorage == 'digest'):
+            return DigestSnapshot()
+        if (self._snapshotStorage == 'wkb'):
+            return WkbSnapshot()
+        return GeometrySnapshot()
+
+    def isSnapshotCapturedOnEdit(self):
+        return (self._snapshotMode in ('lazy', 'extent') or self._snapshotStorage == 'digest' or self._snapshotAsync)
+
+    def captureSnapshotFeature(self, layer, featureId):
+        # store the geometry from the data provider before the edit gets committed
+        snapshot = self.layers.get(layer)
+        if (snapshot is None or featureId < 0 or snapshot.hasGeometry(featureId)):
+            return
+        if (not snapshot.hasFeature(featureId) and self.isVersionTrackingEnabled(layer)):
+            versions = self.featureVersions[layer]
+            try:
+                version = self.getFeatureVersions(layer, [featureId]).get(featureId)
+            except Exception as ex:
+                # the edit is kept, the feature is compared by geometry only
+                self.showCheckFailedMessage(ex)
+                feature = self.getLayerFeature(layer, featureId)
+                if (feature is not None):
+                    snapshot.captureGeometry(featureId, feature.geometry())
+                return
+            if (featureId in versions and versions[featureId] != version):
+                # changed in the database after editing started, the geometry the edit
+                # was made on is not known, an empty one makes the next check a conflict
+                self.dprint(('captureSnapshotFeature: changed since editing started', featureId))
+                snapshot.captureGeometry(featureId, QgsGeometry())
+                return
+            versions[featureId] = version
+        feature = self.getLayerFeature(layer, featureId)
+        if (feature is not None):
+            self.dprint(('captureSnapshotFeature', featureId))
+            snapshot.captureGeometry(featureId, feature.geometry())
+
     def createTemporaryLayer(self, layer):
         # create temporary layer with old geometry
         crs = layer.sourceCrs().authid()
@@ -111,9 +421,9 @@ class EditionResolver:
         geometryName = self.getLayerGeometryTypeName(layer)
         tempLayer = QgsVectorLayer(geometryName+"?crs="+crs, name, "memory")
         tempLayer_dataProvider = tempLayer.dataProvider()
-        layer_clone = layer.clone()
-        self.addFeaturesToLayer(tempLayer_dataProvider,
-                                self.sortFeatureIterator(self.getLayerFeatures(layer)))
+        featureIds = self.addFeaturesToLayer(tempLayer_dataProvider,
+                                             self.getLayerFeatures(layer))
+        self.instrumentation.count('featuresFetched', len(featureIds))
         tempLayer.updateExtents()
         # QgsProject.instance().addMapLayer(tempLayer)
         # tempLayer_nextFeature = next(tempLayer.getFeatures())
@@ -134,15 +444,42 @@ class EditionResolver:
                      tempLayer_dataProvider.featureCount(), tempLayer))
         self.showInfoMessage(
             dictionaries.temporary_control_layer_created(layer), dictionaries.edition_actived)
-        return tempLayer
+        return tempLayer, featureIds
+
+    def getBackupLayer(self, layer):
+        if (layer in self.backupLayers):
+            return self.backupLayers[layer]
+        backupLayer = self.createBackupTemporaryLayer(layer)
+        self.backupLayers[layer] = backupLayer
+        self.backupFeatureIds[layer] = self.createBackupFeatureIndex(
+            backupLayer)
+
+        def _onBackupLayerDeleted():
+            self.dprint(('Removing backup layer handle...'))
+            self.removeSingleListener(
+                backupLayer, backupLayer.willBeDeleted, _onBackupLayerDeleted)
+            if (self.backupLayers.get(layer) is backupLayer):
+                del self.backupLayers[layer]
+                del self.backupFeatureIds[layer]
+        self.addListener(backupLayer, backupLayer.willBeDeleted,
+                         _onBackupLayerDeleted)
+        return backupLayer
+
+    def createBackupFeatureIndex(self, backupLayer):
+        # a backup layer restored with the project is indexed once
+        freq = self.createFeatureRequest(
+            backupLayer, attributes=['id'], geometry=False)
+        features = backupLayer.dataProvider().getFeatures(freq)
+        return {feature.attribute('id'): feature.id() for feature in features}
 
     def createBackupTemporaryLayer(self, layer):
         # create temporary layer with not commited geometry
         crs = layer.sourceCrs().authid()
         name = 'backup_' + layer.name()
-        if (len(QgsProject.instance().mapLayersByName(name)) > 0):
+        backupLayer = self.getLayerByName(name)
+        if (backupLayer is not None):
             self.dprint(('createBackupTemporaryLayer layer exists', name))
-            return QgsProject.instance().mapLayersByName(name)[0]
+            return backupLayer
         geometryName = self.getLayerGeometryTypeName(layer)
         tempLayer = QgsVectorLayer(geometryName+"?crs="+crs, name, "memory")
         tempLayer_dataProvider = tempLayer.dataProvider()
@@ -152,14 +489,10 @@ class EditionResolver:
         return tempLayer
 
     def createTemporaryFeatureBackup(self, layer, featureId, editGeom, replaceFeature=False):
-        backupLayer = self.createBackupTemporaryLayer(layer)
-        backupLayer_features = self.getFeaturesByAttributeValue(
-            self.getLayerFeatures(backupLayer), 'id', featureId)
-        backupLayer_featureId = False
-        if (len(backupLayer_features) > 0):
-            backupLayer_featureId = backupLayer_features[0].id()
+        backupLayer = self.getBackupLayer(layer)
+        backupLayer_featureId = self.backupFeatureIds[layer].get(featureId)
 
-        if (backupLayer_featureId and self.getLayerFeature(backupLayer, backupLayer_featureId).hasGeometry()):
+        if (backupLayer_featureId is not None and self.getLayerFeature(backupLayer, backupLayer_featureId).hasGeometry()):
             if (replaceFeature):
                 self.dprint(
                     ('createTemporaryFeatureBackup feature exists, replacing feature...'))
@@ -173,8 +506,10 @@ class EditionResolver:
             backupFeature = self.createFeatureFromGeometry(editGeom, featureId)
             backupFeature.setFields(backupLayer.fields())
             backupFeature.setAttribute(0, featureId)
-            self.addLayerFeatures(
+            result, addedFeatures = self.addLayerFeatures(
                 backupLayer, [backupFeature])
+            if (result):
+                self.backupFeatureIds[layer][featureId] = addedFeatures[0].id()
         backupLayer.updateExtents()
 
     def getLayers(self):
@@ -183,7 +518,8 @@ class EditionResolver:
         for layer in layers:
             if (self.isLayerValid(layer)):
                 self.addLayerListeners(layer)
-                self.layers[layer] = None
+                # keep the snapshot of a layer in editing
+                self.layers.setdefault(layer, None)
             elif (self.isVectorLayer(layer)):
                 self.addLayerListenersForInvalidLayer(layer)
 
@@ -210,24 +546,218 @@ class EditionResolver:
     # Layer methods
 
     def addFeaturesToLayer(self, layer, features):
+        # memory provider assigns its own feature ids,
+        # returns {source featureId: memory featureId}
+        featureIds = {}
+        chunk = []
         for feature in features:
-            layer.addFeatures([self.createFeatureFromGeometry(
-                feature.geometry(), feature.id())])
-
-    def getLayerFeatures(self, layer):
-        return layer.dataProvider().getFeatures()
+            chunk.append(self.createFeatureFromGeometry(
+                feature.geometry(), feature.id()))
+            if (len(chunk) >= self._snapshotChunkSize):
+                self.addFeaturesChunkToLayer(layer, chunk, featureIds)
+                chunk = []
+        if (len(chunk) > 0):
+            self.addFeaturesChunkToLayer(layer, chunk, featureIds)
+        return featureIds
+
+    def addFeaturesChunkToLayer(self, layer, features, featureIds):
+        sourceFeatureIds = [feature.id() for feature in features]
+        result, addedFeatures = layer.addFeatures(features)
+        for sourceFeatureId, feature in zip(sourceFeatureIds, addedFeatures):
+            featureIds[sourceFeatureId] = feature.id()
+
+    def getProviderAdapter(self, layer):
+        return ProviderAdapters.getProviderAdapter(layer)
+
+    def getLayerFeatures(self, layer, attributes=None):
+        self.instrumentation.count('requests')
+        return self.getProviderAdapter(layer).getFeatures(
+            layer, self.createFeatureRequest(layer, attributes=attributes))
 
     def getLayerFeature(self, layer, featureId):
-        provider = layer.dataProvider()
-        if (provider.name() == 'memory'):
+        if (layer.dataProvider().name() == 'memory'):
             return layer.getFeature(featureId)
-        if (provider.name() == 'postgres'):
-            freq = QgsFeatureRequest()
-            freq.setFilterFid(featureId)
-            freq_features = provider.getFeatures(freq)
-            return list(freq_features)[0]
+        adapter = self.getProviderAdapter(layer)
+        if (adapter is not None):
+            freq = self.createFeatureRequest(layer, [featureId])
+            self.instrumentation.count('requests')
+            freq_features = adapter.getFeatures(layer, freq)
+            return next(iter(freq_features), None)
         return None
 
+    def getLayerFeaturesByIds(self, layer, featureIds, simplify=True):
+        getFeatures = self.getReadFeatures(layer)
+        features = {}
+        for freq in self.getFeatureRequests(layer, featureIds, simplify=simplify):
+            self.instrumentation.count('requests')
+            for feature in getFeatures(freq):
+                features[feature.id()] = feature
+        self.instrumentation.count('featuresFetched', len(features))
+        return features
+
+    def getReadPool(self, layer):
+        # pools are shared by the layers of a database
+        if (self._readPoolSize <= 0 or self._compareSimplifyTolerance is not None
+                or not ReadConnectionPool.isAvailable()):
+            return None
+        connectionInfo = self.getProviderAdapter(layer).getReadConnectionInfo(layer)
+        if (connectionInfo is None):
+            return None
+        if (connectionInfo not in self.readPools):
+            try:
+                self.readPools[connectionInfo] = ReadConnectionPool.ReadConnectionPool(
+                    connectionInfo, self._readPoolSize, self._readStatementTimeout)
+            except Exception as ex:
+                self.dprint(('getReadPool', ex))
+                # do not connect again at every check
+                self.readPools[connectionInfo] = None
+        return self.readPools[connectionInfo]
+
+    def getReadFeatureSource(self, layer):
+        # None if the layer is read through its data provider
+        pool = self.getReadPool(layer)
+        if (pool is None):
+            return None
+        return self.getProviderAdapter(layer).createReadFeatureSource(layer, pool)
+
+    def getReadFeatures(self, layer):
+        featureSource = self.getReadFeatureSource(layer)
+        if (featureSource is not None):
+            return featureSource.getFeatures
+        adapter = self.getProviderAdapter(layer)
+        return lambda freq: adapter.getFeatures(layer, freq)
+
+    def getChangeToken(self, layer):
+        try:
+            return self.getProviderAdapter(layer).getChangeToken(layer)
+        except Exception as ex:
+            self.dprint(('getChangeToken', ex))
+            return None
+
+    def isSourceUnchanged(self, layer):
+        # nothing was written to the source since the snapshot was taken
+        changeToken = self.changeTokens.get(layer)
+        return (changeToken is not None and changeToken == self.getChangeToken(layer))
+
+    def isVersionTrackingEnabled(self, layer):
+        return (self._versionColumn is not None and layer in self.featureVersions)
+
+    def getFeatureVersions(self, layer, featureIds=None):
+        # returns {featureId: version}, all features if featureIds is None,
+        # only reads filtered by feature ids go through the read pool
+        return self.createVersionReader(layer, isPooled=featureIds is not None)(featureIds)
+
+    def getInitialFeatureVersions(self, layer):
+        # a failed read leaves the features to be compared by geometry
+        try:
+            return self.getFeatureVersions(layer)
+        except Exception as ex:
+            self.dprint(('getInitialFeatureVersions', ex))
+            self.showWarningMessage(dictionaries.versions_read_failed(layer, ex))
+            return {}
+
+    def createVersionReader(self, layer, getFeatures=None, isPooled=True):
+        # returns readVersions(featureIds) created in the main thread,
+        # it does not access the layer and may run in a worker thread,
+        # the read pool limits the time of a statement, it is meant for reads by feature ids
+        if (self._versionColumn is None):
+            return lambda featureIds=None: {}
+        if (self._versionColumn == 'xmin'):
+            return self.createTransactionIdReader(layer, isPooled)
+        fieldIndex = layer.fields().lookupField(self._versionColumn)
+        if (fieldIndex < 0):
+            self.dprint(('createVersionReader: missing column', self._versionColumn))
+            return lambda featureIds=None: {}
+        if (getFeatures is None and isPooled):
+            getFeatures = self.getReadFeatures(layer)
+        elif (getFeatures is None):
+            adapter = self.getProviderAdapter(layer)
+            getFeatures = lambda freq: adapter.getFeatures(layer, freq)
+
+        def _readVersions(featureIds=None):
+            versions = {}
+            for freq in self.getFeatureRequests(layer, featureIds, [fieldIndex], geometry=False):
+                self.instrumentation.count('requests')
+                for feature in getFeatures(freq):
+                    versions[feature.id()] = feature.attribute(fieldIndex)
+            return versions
+        return _readVersions
+
+    def createTransactionIdReader(self, layer, isPooled=True):
+        # errors are raised by the reader, reads that fail are reported by the callers
+        pool = self.getReadPool(layer) if isPooled else None
+        try:
+            readTransactionIds = self.getProviderAdapter(layer).createTransactionIdReader(
+                layer, pool)
+        except Exception as ex:
+            self.dprint(('createTransactionIdReader', ex))
+            error = ex
+
+            def _raiseError(featureIds=None):
+                raise error
+            return _raiseError
+        chunkSize = self._fetchChunkSize
+
+        def _readVersions(featureIds=None):
+            self.instrumentation.count('requests')
+            return readTransactionIds(featureIds, chunkSize)
+        return _readVersions
+
+    def updateFeatureVersions(self, layer, featureIds):
+        if (not self.isVersionTrackingEnabled(layer)):
+            return
+        versions = self.featureVersions[layer]
+        try:
+            versions.update(self.getFeatureVersions(layer, featureIds))
+        except Exception as ex:
+            # features without a version are compared by geometry at the next check
+            self.dprint(('updateFeatureVersions', ex))
+            for featureId in featureIds:
+                versions.pop(featureId, None)
+
+    def getVersionChangedFeatureIds(self, layer, featureIds, readVersions):
+        # returns (changed featureIds, {featureId: current version})
+        versions = self.featureVersions[layer]
+        currentVersions = readVersions(featureIds)
+        return ([featureId for featureId in featureIds
+                 if featureId not in versions or versions[featureId] != currentVersions.get(featureId)],
+                currentVersions)
+
+    def createFeatureRequest(self, layer, featureIds=None, attributes=None, geometry=True, simplify=True):
+        # every read of the resolver goes through this request,
+        # attributes are fetched only if requested by name or field index,
+        # a request without names does not access the layer (worker threads)
+        freq = QgsFeatureRequest()
+        if (featureIds is not None):
+            freq.setFilterFids(list(featureIds))
+        if (attributes is None):
+            freq.setNoAttributes()
+        elif (all(isinstance(attribute, int) for attribute in attributes)):
+            freq.setSubsetOfAttributes(attributes)
+        else:
+            freq.setSubsetOfAttributes(attributes, layer.fields())
+        if (not geometry):
+            freq.setFlags(freq.flags() | QgsFeatureRequest.NoGeometry)
+        elif (simplify and self._compareSimplifyTolerance is not None):
+            simplifyMethod = QgsSimplifyMethod()
+            simplifyMethod.setMethodType(
+                QgsSimplifyMethod.OptimizeForRendering)
+            simplifyMethod.setTolerance(self._compareSimplifyTolerance)
+            # let the data provider simplify before the transfer
+            simplifyMethod.setForceLocalOptimization(False)
+            freq.setSimplifyMethod(simplifyMethod)
+        return freq
+
+    def getFeatureRequests(self, layer, featureIds=None, attributes=None, geometry=True, simplify=True):
+        if (featureIds is None):
+            return [self.createFeatureRequest(layer, None, attributes, geometry, simplify)]
+        featureIds = list(featureIds)
+        requests = []
+        for start in range(0, len(featureIds), self._fetchChunkSize):
+            requests.append(self.createFeatureRequest(
+                layer, featureIds[start:start + self._fetchChunkSize], attributes, geometry, simplify))
+        return requests
+
     def getLayerGeometryTypeName(self, layer):
         return QgsWkbTypes.geometryDisplayString(layer.geometryType())
 
@@ -237,15 +767,8 @@ class EditionResolver:
     def updateLayerDataProvider(self, layer):
         layer.dataProvider().reloadData()
 
-    def replaceTemporaryFeature(self, layer, featureId):
-        # feature = QgsFeature(featureId)
-        # feature.setGeometry(self.getLayerFeature(layer, featureId).geometry())
-        self.layers[layer].dataProvider().changeGeometryValues(
-            {featureId: self.getLayerFeature(layer, featureId).geometry()})
-        self.layers[layer].updateExtents()
-
     def addLayerFeatures(self, layer, features):
-        layer.dataProvider().addFeatures(features)
+        return layer.dataProvider().addFeatures(features)
 
     def changeLayerDataProviderFeatureGeometry(self, layer, featureId, geometry):
         layer.dataProvider().changeGeometryValues(
@@ -255,8 +778,8 @@ class EditionResolver:
     def rollbackEditionBuffer(self, layer, featureId, geometry):
         layer.editBuffer().changedGeometries().pop(featureId, None)
         layer.editBuffer().changeGeometry(featureId, geometry)
-        self.dprint(('rollbackEditionBuffer',
-                     layer.editBuffer().changedGeometries()))
+        self.dprint(lambda: ('rollbackEditionBuffer',
+                             layer.editBuffer().changedGeometries()))
         # layer.editBuffer().changedGeometries().changedGeometries()[featureId] = geometry
 
     # Feature methods
@@ -268,12 +791,10 @@ class EditionResolver:
                 feats.append(feature)
         return feats
 
-    def sortFeatureIterator(self, featuresIterator):
-        features = {}
-        for feature in featuresIterator:
-            features[feature.id()] = feature
-        self.dprint(('sortFeatureIterator: sorting features...'))
-        return list(dict(sorted(features.items())).values())
+    def createGeometryFromWkb(self, geometryWkb):
+        geometry = QgsGeometry()
+        geometry.fromWkb(geometryWkb)
+        return geometry
 
     def createFeatureFromGeometry(self, geometry, featureId=None):
         if (featureId is not None):
@@ -283,56 +804,199 @@ class EditionResolver:
         feature.setGeometry(geometry)
         return feature
 
-    def getDifferences(self, oldFeature, newFeature):
-        oldFeature_wkt = wkt.loads(oldFeature.geometry().asWkt())
-        newFeature_wkt = wkt.loads(newFeature.geometry().asWkt())
-        cut = (newFeature_wkt - oldFeature_wkt).wkt
-        expand = (oldFeature_wkt - newFeature_wkt).wkt
-        return (cut, expand)
-
-    def rollbackFeatureEdition(self, layer, featureId, newGeom):
-        self.replaceTemporaryFeature(layer, featureId)
-        self.changeLayerDataProviderFeatureGeometry(layer, featureId, newGeom)
-        self.updateLayerDataProvider(layer)
-        self.updateLayerDataProvider(self.layers[layer])
-        self.rollbackEditionBuffer(layer, featureId, newGeom)
-        try:
-            self.dprint(('rollbackFeatureEdition',
-                         layer.editBuffer().changedGeometries()[featureId].asWkt()))
-        except:
-            self.dprint(('rollbackFeatureEdition',
-                         layer.editBuffer().changedGeometries()))
+    def getDifferences(self, oldGeometries, newGeometries):
+        return differences.getDifferences(oldGeometries, newGeometries)
 
-        self.iface.mapCanvas().refresh()
+    def createDifferenceTemporaryLayer(self, layer):
+        # create temporary layer with differences of conflicting geometries
+        name = 'diff_' + layer.name()
+        differenceLayer = self.getLayerByName(name)
+        if (differenceLayer is not None):
+            return differenceLayer
+        crs = layer.sourceCrs().authid()
+        differenceLayer = QgsVectorLayer("MultiPolygon?crs="+crs, name, "memory")
+        differenceLayer.dataProvider().addAttributes(
+            [QgsField("id", QVariant.Int), QgsField("type", QVariant.String)])
+        differenceLayer.updateFields()
+        QgsProject.instance().addMapLayer(differenceLayer)
+        return differenceLayer
+
+    def createFeatureDifferences(self, layer, geometries):
+        # geometries: {featureId: (snapshot geometry, database geometry)}
+        if (len(geometries) == 0):
+            return
+        featureIds = list(geometries.keys())
+        try:
+            cuts, expands = self.getDifferences([geometries[featureId][0] for featureId in featureIds],
+                                                [geometries[featureId][1] for featureId in featureIds])
+        except Exception as ex:
+            # the differences are only informative, conflicts are already resolved
+            self.dprint(('createFeatureDifferences', ex))
+            return
+        differenceLayer = self.createDifferenceTemporaryLayer(layer)
+        features = []
+        for differenceType, differenceGeometries in (('cut', cuts), ('expand', expands)):
+            for featureId, geometry in zip(featureIds, differenceGeometries):
+                if (geometry.isEmpty()):
+                    continue
+                geometry.convertToMultiType()
+                feature = self.createFeatureFromGeometry(geometry)
+                feature.setFields(differenceLayer.fields())
+                feature.setAttribute('id', featureId)
+                feature.setAttribute('type', differenceType)
+                features.append(feature)
+        self.addLayerFeatures(differenceLayer, features)
+        differenceLayer.updateExtents()
+        differenceLayer.triggerRepaint()
+
+    def updateCommittedFeatures(self, layer, featureIds, removedFeatureIds):
+        # the edit session stays open, only committed features are copied again
+        snapshot = self.layers.get(layer)
+        if (snapshot is None):
+            return
+        self.dprint(('updateCommittedFeatures', featureIds, removedFeatureIds))
+        for featureId in removedFeatureIds:
+            snapshot.removeFeature(featureId)
+            if (layer in self.featureVersions):
+                self.featureVersions[layer].pop(featureId, None)
+        featureIds = [featureId for featureId in featureIds
+                      if featureId not in removedFeatureIds]
+        self.updateFeatureVersions(layer, featureIds)
+        for featureId, feature in self.getLayerFeaturesByIds(layer, featureIds).items():
+            snapshot.setGeometry(featureId, feature.geometry())
+
+    def rollbackFeatureEditions(self, layer, geometries):
+        # geometries: {featureId: current database geometry}
+        conflictGeometries = self.conflictGeometries.pop(layer, {})
+        if (len(geometries) == 0 or self.layers.get(layer) is None):
+            return
+        with self.instrumentation.span('rollback'):
+            snapshotGeometries = geometries
+            if (self._compareSimplifyTolerance is not None):
+                # the snapshot keeps geometries simplified the same way as the checks
+                snapshotGeometries = {featureId: feature.geometry() for featureId, feature
+                                      in self.getLayerFeaturesByIds(layer, geometries.keys()).items()}
+            for featureId, geometry in snapshotGeometries.items():
+                self.layers[layer].setGeometry(featureId, geometry)
+            for featureId, geometry in geometries.items():
+                self.rollbackEditionBuffer(layer, featureId, geometry)
+        self.dprint(('rollbackFeatureEditions', list(geometries.keys())))
+        if (layer in self.iface.mapCanvas().layers()):
+            # a layer not drawn on the map is not rendered,
+            # it would skip the check of the next render of the user
+            self._ownRenderLayers.add(layer)
+        layer.triggerRepaint()
+        self.createFeatureDifferences(layer, conflictGeometries)
 
     # Feature validations
 
     def compareGeometries(self, oldFeature, newFeature):
-        return oldFeature.equals(newFeature)
+        return comparators.compareGeometries(oldFeature, newFeature, self._compareTolerance)
 
-    def checkEditedFeatures(self, layer, callback=None):
+    def isSnapshotGeometryEqual(self, snapshot, featureId, tempGeometry, dbGeometry):
+        # digest snapshots keep no geometry of features not edited yet
+        if (tempGeometry is None):
+            return snapshot.matchesGeometry(featureId, dbGeometry)
+        return self.compareGeometries(tempGeometry, dbGeometry)
+
+    def checkEditedFeatures(self, layer, callback=None, featureIds=None):
+        # returns {featureId: current database geometry} of features changed in the database
         self.dprint((layer, callback))
+        featureIds = self.getCheckedFeatureIds(layer, featureIds)
+        if (len(featureIds) == 0):
+            return {}
+        # only checks reading the data provider are counted
+        self.checkCount += 1
+        getFeatures = self.getReadFeatures(layer)
+        featureIds, dbFeatures, currentVersions = self.readEditedFeatures(
+            layer, featureIds, getFeatures, self.createVersionReader(layer, getFeatures))
+        return self.resolveEditedFeatures(layer, callback, featureIds, dbFeatures, currentVersions)
+
+    def getCheckedFeatureIds(self, layer, featureIds=None):
         if (self.layers[layer] is None):
-            return
-        for featureId in layer.editBuffer().changedGeometries():
-            tempFeature_geometry = self.getLayerFeature(
-                self.layers[layer], featureId).geometry()
-            dbFeature_geometry = self.getLayerFeature(
-                layer, featureId).geometry()
-            editFeature_geometry = layer.editBuffer().changedGeometries()[
-                featureId]
-            if (self.compareGeometries(tempFeature_geometry, dbFeature_geometry)):
+            return []
+        changedGeometries = layer.editBuffer().changedGeometries()
+        if (len(changedGeometries) == 0):
+            return []
+        if (self.isSourceUnchanged(layer)):
+            self.dprint(('checkEditedFeatures: source not changed since snapshot'))
+            self.instrumentation.count('checksSkipped')
+            return []
+        if (featureIds is None):
+            featureIds = list(changedGeometries.keys())
+        else:
+            featureIds = [featureId for featureId in featureIds
+                          if featureId in changedGeometries]
+        snapshot = self.layers[layer]
+        return [featureId for featureId in featureIds
+                if snapshot.hasFeature(featureId)]
+
+    def readEditedFeatures(self, layer, featureIds, getFeatures, readVersions):
+        # data provider reads of a check, may run in a worker thread with getFeatures
+        # of a feature source and readVersions created in the main thread,
+        # returns (checked featureIds, {featureId: feature}, {featureId: version})
+        currentVersions = {}
+        if (self.isVersionTrackingEnabled(layer) and len(featureIds) > 0):
+            featureIds, currentVersions = self.getVersionChangedFeatureIds(
+                layer, featureIds, readVersions)
+            self.dprint(('checkEditedFeatures: versions changed', featureIds))
+        dbFeatures = {}
+        for freq in self.getFeatureRequests(layer, featureIds):
+            self.instrumentation.count('requests')
+            for feature in getFeatures(freq):
+                dbFeatures[feature.id()] = feature
+        self.instrumentation.count('featuresFetched', len(dbFeatures))
+        return featureIds, dbFeatures, currentVersions
+
+    def resolveEditedFeatures(self, layer, callback, featureIds, dbFeatures, currentVersions):
+        snapshot = self.layers.get(layer)
+        if (len(featureIds) == 0 or snapshot is None):
+            return {}
+        changedGeometries = layer.editBuffer().changedGeometries()
+        tempGeometries = snapshot.getGeometries(featureIds)
+        equalFeatureIds = []
+        changedFeatureIds = []
+        for featureId in featureIds:
+            if (featureId not in dbFeatures):
+                self.dprint(('checkEditedFeatures: feature not in database', featureId))
+                continue
+            tempFeature_geometry = tempGeometries.get(featureId)
+            dbFeature_geometry = dbFeatures[featureId].geometry()
+            if (self.instrumentation.isEnabled()):
+                self.instrumentation.count(
+                    'comparedGeometryBytes', len(dbFeature_geometry.asWkb()))
+            if (self.isSnapshotGeometryEqual(snapshot, featureId, tempFeature_geometry, dbFeature_geometry)):
                 self.dprint(('checkEditedFeatures: features equal'))
+                equalFeatureIds.append(featureId)
             else:
                 self.dprint(('checkEditedFeatures: features not equal',
-                             #  editFeature_geometry.asWkt(),
                              'tempFeature_geometry',
-                             tempFeature_geometry.asWkt(),
+                             tempFeature_geometry,
                              'dbFeature_geometry',
-                             dbFeature_geometry.asWkt()))
-                if (callback is not None):
-                    callback(layer, featureId, tempFeature_geometry,
-                             dbFeature_geometry, editFeature_geometry)
+                             dbFeature_geometry))
+                changedFeatureIds.append(featureId)
+        if (self._compareSimplifyTolerance is not None and len(changedFeatureIds) > 0):
+            # rollback needs geometries without simplification
+            dbFeatures.update(self.getLayerFeaturesByIds(
+                layer, changedFeatureIds, simplify=False))
+        if (callback is not None):
+            for featureId in changedFeatureIds:
+                callback(layer, featureId, tempGeometries.get(featureId),
+                         dbFeatures[featureId].geometry(), changedGeometries[featureId])
+        if (self._differenceLayer and callback is not None):
+            # computed by rollbackFeatureEditions once the conflicts are handled
+            self.conflictGeometries[layer] = {featureId: (tempGeometries[featureId], dbFeatures[featureId].geometry())
+                                              for featureId in changedFeatureIds
+                                              if featureId in tempGeometries and not tempGeometries[featureId].isEmpty()}
+        if (self.isVersionTrackingEnabled(layer)):
+            # versions read before the geometries, a change committed in between
+            # is only checked again; attributes of equal features changed,
+            # do not download their geometries again, versions of changed features
+            # go with the geometries written to the snapshot by rollbackFeatureEditions
+            self.featureVersions[layer].update(
+                {featureId: currentVersions[featureId] for featureId in equalFeatureIds + changedFeatureIds
+                 if featureId in currentVersions})
+        return {featureId: dbFeatures[featureId].geometry() for featureId in changedFeatureIds}
 
     # layer listeners
 
@@ -343,19 +1007,38 @@ class EditionResolver:
 
     def addLayerListeners(self, layer):
         self.dprint(('addLayerListeners', layer))
+        if (self.listeners.hasOwner(layer.id())):
+            # the project is read again, the layer is already connected
+            self.dprint(('addLayerListeners: layer already connected', layer))
+            return
 
-        def _onRenderStarted():
-            def _onProviderChanged(layer, featureId, oldGeom, newGeom, editGeom):
-                message = dictionaries.featureChangedInDatabase(
-                    layer, featureId)
+        def _onProviderChanged(layer, featureId, oldGeom, newGeom, editGeom):
+            message = dictionaries.featureChangedInDatabase(
+                layer, featureId)
+            with self.instrumentation.span('backup'):
                 self.createTemporaryFeatureBackup(
                     layer, featureId, editGeom)
-                self.showWarningMessage(
-                    message)
-                self.rollbackFeatureEdition(layer, featureId, newGeom)
-            if (self._isQgisOldVersion):
-                self.updateLayerDataProvider(layer)
-            self.checkDataProvider(layer, _onProviderChanged)
+            self.showWarningMessage(
+                message)
+
+        def _checkEditedFeatures(featureIds=None):
+            self.rollbackFeatureEditions(layer, self.checkDataProvider(
+                layer, _onProviderChanged, featureIds))
+
+        def _onRenderStarted():
+            if (layer in self._ownRenderLayers):
+                self._ownRenderLayers.discard(layer)
+                self.dprint(('_onRenderStarted: own render, check skipped', layer))
+                self.instrumentation.count('checksSkipped')
+                return
+
+            def _createCheck():
+                if (self._isQgisOldVersion):
+                    self.updateLayerDataProvider(layer)
+                return self.createLayerCheck(layer, _onProviderChanged,
+                                             lambda geometries: self.rollbackFeatureEditions(layer, geometries))
+            self.checkScheduler.schedule(
+                layer.id(), _createCheck, lambda: self.hasChangedGeometries(layer))
 
         def _onRenderComplete():
             def compareTemporaryLayer():
@@ -379,59 +1062,114 @@ class EditionResolver:
         #     pass
 
         def _removeCanvasListeners():
+            self.checkScheduler.cancel(layer.id())
+            self.removeSingleListener(self.iface.mapCanvas(
+            ), self.iface.mapCanvas().extentsChanged, _onExtentsChanged, layer.id())
             self.removeSingleListener(self.iface.mapCanvas(
-            ), self.iface.mapCanvas().renderStarting, _onRenderStarted)
+            ), self.iface.mapCanvas().renderStarting, _onRenderStarted, layer.id())
             self.removeSingleListener(self.iface.mapCanvas(
-            ), self.iface.mapCanvas().renderComplete, _onRenderComplete)
+            ), self.iface.mapCanvas().renderComplete, _onRenderComplete, layer.id())
 
         def _removeLayerEditionListeners():
             # self.removeSingleListener(
             #     layer, layer.beforeModifiedCheck, _onBeforeModifiedCheck)
-            pass
+            self.removeSingleListener(
+                layer, layer.geometryChanged, _onGeometryChanged)
+
+        def _onGeometryChanged(featureId, geometry):
+            self.captureSnapshotFeature(layer, featureId)
+
+        def _onExtentsChanged():
+            if (self.layers.get(layer) is not None):
+                self.extendSnapshot(
+                    layer, self.layers[layer], self.getCanvasExtent(layer))
 
         def _onEditingStarted():
             self.dprint(('_onEditingStarted'))
             self.updateLayerDataProvider(layer)
-            self.layers[layer] = self.createTemporaryLayer(layer)
+            with self.instrumentation.span('snapshot'):
+                self.layers[layer] = self.createSnapshot(layer)
+            if (self.isSnapshotCapturedOnEdit()):
+                self.addListener(layer, layer.geometryChanged,
+                                 _onGeometryChanged)
+            if (self._snapshotMode == 'extent'):
+                self.addListener(self.iface.mapCanvas(
+                ), self.iface.mapCanvas().extentsChanged, _onExtentsChanged, layer.id())
+            if (self._pushMode):
+                if (self.startNotificationListener(layer, _checkEditedFeatures)):
+                    return
+                self.showInfoMessage(
+                    dictionaries.push_mode_unavailable(layer))
             self.addListener(self.iface.mapCanvas(
-            ), self.iface.mapCanvas().renderStarting, _onRenderStarted)
+            ), self.iface.mapCanvas().renderStarting, _onRenderStarted, layer.id())
             self.addListener(self.iface.mapCanvas(
-            ), self.iface.mapCanvas().renderComplete, _onRenderComplete)
+            ), self.iface.mapCanvas().renderComplete, _onRenderComplete, layer.id())
             # self.addListener(layer, layer.beforeModifiedCheck,
             #                  _onBeforeModifiedCheck)
 
         def _onEditingStopped():
             self.dprint(('_onEditingStopped'))
+            self.instrumentation.logReport()
+            # every edit session is reported on its own
+            self.instrumentation.reset()
             self.deleteTemporaryLayer(layer)
+            self.stopNotificationListener(layer)
             _removeCanvasListeners()
             _removeLayerEditionListeners()
 
+        committedFeatureIds = set()
+        removedFeatureIds = set()
+        isSourceUnchanged = False
+
+        def _onCommittedGeometriesChanges(layerId, changedGeometries):
+            committedFeatureIds.update(changedGeometries.keys())
+
+        def _onCommittedFeaturesAdded(layerId, addedFeatures):
+            committedFeatureIds.update(
+                feature.id() for feature in addedFeatures)
+
+        def _onCommittedFeaturesRemoved(layerId, deletedFeatureIds):
+            removedFeatureIds.update(deletedFeatureIds)
+
         def _onBeforeCommitChanges():
+            nonlocal isSourceUnchanged
+            committedFeatureIds.clear()
+            removedFeatureIds.clear()
+            isSourceUnchanged = self.isSourceUnchanged(layer)
+
             def _onProviderChanged(layer, featureId, oldGeom, newGeom, editGeom):
                 self.dprint(
-                    ('oldGeom', oldGeom.asWkt(), 'newGeom', newGeom.asWkt(), 'editGeom', editGeom.asWkt()))
+                    ('oldGeom', oldGeom, 'newGeom', newGeom, 'editGeom', editGeom))
                 message = dictionaries.featureChangedInDatabase(
                     layer, featureId)
-                self.createTemporaryFeatureBackup(
-                    layer, featureId, editGeom, True)
+                with self.instrumentation.span('backup'):
+                    self.createTemporaryFeatureBackup(
+                        layer, featureId, editGeom, True)
                 self.showWarningMessage(
                     message, dictionaries.warning_before_commit_changes)
-                self.rollbackFeatureEdition(layer, featureId, newGeom)
-            self.checkDataProvider(layer, _onProviderChanged)
+            self.rollbackFeatureEditions(
+                layer, self.checkDataProvider(layer, _onProviderChanged))
 
         def _onAfterCommitChanges():
-            def resetEdition():
-                self.dprint('resetEdition')
-                layer.rollBack(True)  # remove editions
-                layer.startEditing()
-            resetEdition()
-            self.updateLayerDataProvider(layer)
+            if (not self.isLayerEditionActive(layer)):
+                # editing stops with the commit, the snapshot is deleted next
+                committedFeatureIds.clear()
+                removedFeatureIds.clear()
+                return
+            if (isSourceUnchanged and layer in self.changeTokens):
+                # nobody else wrote to the source, only this commit changed it
+                self.changeTokens[layer] = self.getChangeToken(layer)
+            self.updateCommittedFeatures(
+                layer, committedFeatureIds, removedFeatureIds)
+            committedFeatureIds.clear()
+            removedFeatureIds.clear()
 
         def _onWillBeDeleted():
             self.dprint(('Removing layer dependecies...'))
             self.removeSingleListener(
                 layer, layer.willBeDeleted, _onWillBeDeleted)
             _removeCanvasListeners()
+            self.stopNotificationListener(layer)
             self.removeLayerListenersByLayerId(layer.id())
 
         self.addListener(layer, layer.editingStarted, _onEditingStarted)
@@ -441,18 +1179,18 @@ class EditionResolver:
                          _onBeforeCommitChanges)
         self.addListener(layer, layer.afterCommitChanges,
                          _onAfterCommitChanges)
+        self.addListener(layer, layer.committedGeometriesChanges,
+                         _onCommittedGeometriesChanges)
+        self.addListener(layer, layer.committedFeaturesAdded,
+                         _onCommittedFeaturesAdded)
+        self.addListener(layer, layer.committedFeaturesRemoved,
+                         _onCommittedFeaturesRemoved)
         self.addListener(layer, layer.willBeDeleted, _onWillBeDeleted)
 
     def removeLayerListenersByLayerId(self, layerId):
-        for object, signal, callback in self.listeners:
-            try:
-                self.dprint(('removeLayerListenersByLayerId', object, signal))
-                if (self.isTypeOfMapLayer(object) and object.id() == layerId):
-                    self.dprint((signal, object, 'disconnected'))
-                    signal.disconnect(callback)
-                    self.listeners.remove((object, signal, callback))
-            except Exception as ex:
-                self.dprint(('removeLayerListenersByLayerId', layerId, ex))
+        # also the map canvas listeners added for the layer
+        self.dprint(('removeLayerListenersByLayerId', layerId))
+        self.listeners.removeOwner(layerId)
 
     def addTemporaryLayerListeners(self, tempLayer, layer):
         def _onWillBeDeleted():
@@ -465,8 +1203,98 @@ class EditionResolver:
 
     # Layer validations
 
-    def checkDataProvider(self, layer, callback=None):
-        self.checkEditedFeatures(layer, callback)
+    def checkDataProvider(self, layer, callback=None, featureIds=None):
+        if (self._isChecking):
+            self.dprint(('checkDataProvider: check already running', layer))
+            self.instrumentation.count('checksSkipped')
+            return {}
+        self._isChecking = True
+        try:
+            with self.instrumentation.span('check'):
+                return self.checkEditedFeatures(layer, callback, featureIds)
+        except Exception as ex:
+            self.showCheckFailedMessage(ex)
+            return {}
+        finally:
+            self._isChecking = False
+
+    def createLayerCheck(self, layer, callback, onResolved):
+        # returns (read, resolve) for the check coordinator or None if there is nothing to check,
+        # everything read touches is created here in the main thread
+        featureIds = self.getCheckedFeatureIds(layer)
+        if (len(featureIds) == 0):
+            return None
+        self.checkCount += 1
+        featureSource = self.getReadFeatureSource(layer)
+        if (featureSource is None):
+            featureSource = self.getProviderAdapter(layer).createFeatureSource(layer)
+        readVersions = self.createVersionReader(layer, featureSource.getFeatures)
+
+        def _read():
+            return self.readEditedFeatures(layer, featureIds, featureSource.getFeatures, readVersions)
+
+        def _resolve(result):
+            checkedFeatureIds, dbFeatures, currentVersions = result
+            onResolved(self.resolveEditedFeatures(
+                layer, callback, checkedFeatureIds, dbFeatures, currentVersions))
+        return (_read, _resolve)
+
+    def runChecks(self, checks):
+        # checks of all layers due at one render
+        if (self._isChecking):
+            self.dprint(('runChecks: check already running'))
+            self.instrumentation.count('checksSkipped')
+            return
+        self._isChecking = True
+        try:
+            with self.instrumentation.span('check'):
+                self.checkCoordinator.run(checks)
+        finally:
+            self._isChecking = False
+
+    def showCheckFailedMessage(self, ex):
+        # the edited features were not compared, it is not a check without conflicts
+        self.dprint(('checkFailed', ex))
+        self.instrumentation.count('checksFailed')
+        self.showWarningMessage(dictionaries.check_failed(ex))
+
+    def getCheckCount(self):
+        return self.checkCount
+
+    def startNotificationListener(self, layer, check):
+        keyColumn = self.getProviderAdapter(layer).getPrimaryKeyColumn(layer)
+        if (not NotificationListener.isAvailable() or keyColumn is None):
+            return False
+        uri = QgsDataSourceUri(layer.source())
+
+        def _onNotify(featureIds):
+            self.dprint(('_onNotify', layer, featureIds))
+            if (self.isLayerEditionActive(layer)):
+                check(featureIds)
+        try:
+            listener = NotificationListener.NotificationListener(
+                uri.connectionInfo(True), uri.schema() or 'public', uri.table(), keyColumn, _onNotify)
+        except Exception as ex:
+            self.dprint(('startNotificationListener', ex))
+            return False
+        try:
+            if (self._pushInstallTrigger):
+                listener.installTrigger()
+            if (not listener.hasTrigger()):
+                listener.close()
+                return False
+            listener.listen()
+        except Exception as ex:
+            self.dprint(('startNotificationListener', ex))
+            listener.close()
+            return False
+        self.notificationListeners[layer] = listener
+        return True
+
+    def stopNotificationListener(self, layer):
+        listener = self.notificationListeners.pop(layer, None)
+        if (listener is not None):
+            listener.close()
 
     def isLayerValid(self, layer):
         if (self.isFromDatabase(layer) and self.isVectorLayer(layer) and self.isSpatial(layer) and self.isPolygon(layer)):
@@ -479,7 +1307,7 @@ class EditionResolver:
         return layer.isSpatial()
 
     def isFromDatabase(self, layer):
-        return layer.dataProvider().name() == 'postgres'
+        return self.getProviderAdapter(layer) is not None
 
     def isPolygon(self, layer):
         return self.getLayerGeometryTypeName(layer).lower() == 'polygon'
@@ -490,6 +1318,9 @@ class EditionResolver:
     def isLayerEditionActive(self, layer):
         return isinstance(layer.editBuffer(), QgsVectorLayerEditBuffer)
 
+    def hasChangedGeometries(self, layer):
+        return (self.isLayerEditionActive(layer) and len(layer.editBuffer().changedGeometries()) > 0)
+
     # qgis project/map listeners
 
     def _onNewLayerAdded(self):
@@ -518,6 +1349,12 @@ class EditionResolver:
         self.addListener(self.iface.mapCanvas(), self.iface.mapCanvas(
         ).currentLayerChanged, _currentLayerChanged)
 
+    def _onMapCanvasRefreshed(self):
+        def _mapCanvasRefreshed():
+            self._ownRenderLayers.clear()
+        self.addListener(self.iface.mapCanvas(), self.iface.mapCanvas(
+        ).mapCanvasRefreshed, _mapCanvasRefreshed)
+
     def _onReadProject(self):
         def _readProject():
             self.dprint('_onReadProject')
@@ -548,7 +1385,10 @@ class EditionResolver:
     # debug message
 
     def dprint(self, message):
+        # message can be a function, called only in debug mode
         if (self._debug == True):
+            if (callable(message)):
+                message = message()
             try:
                 pprint.pprint(message)
             except:
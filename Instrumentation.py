@@ -0,0 +1,90 @@
+from qgis.core import Qgis, QgsMessageLog
+import threading
+import time
+
+
+LOG_TAG = 'EditionReloader'
+
+
+class NullSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.instrumentation.addSpan(
+            self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Instrumentation:
+    """
+    Pomiar czasu i liczniki operacji wtyczki,
+    wyłączone nie wykonują żadnych pomiarów
+    """
+
+    def __init__(self, isEnabled):
+        # the setting is read at every measurement, it can be changed any time
+        self.isEnabled = isEnabled
+        # {name: [count, total seconds, max seconds]}
+        self.spans = {}
+        self.counters = {}
+        # checks read the database in worker threads
+        self.lock = threading.Lock()
+
+    def span(self, name):
+        if (not self.isEnabled()):
+            return NULL_SPAN
+        return Span(self, name)
+
+    def addSpan(self, name, seconds):
+        with self.lock:
+            span = self.spans.setdefault(name, [0, 0.0, 0.0])
+            span[0] += 1
+            span[1] += seconds
+            span[2] = max(span[2], seconds)
+
+    def count(self, name, value=1):
+        if (self.isEnabled()):
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def getReport(self):
+        return {
+            'spans': {name: {'count': count, 'seconds': total, 'maxSeconds': maximum}
+                      for name, (count, total, maximum) in self.spans.items()},
+            'counters': dict(self.counters),
+        }
+
+    def reset(self):
+        with self.lock:
+            self.spans.clear()
+            self.counters.clear()
+
+    def logReport(self):
+        # shown in the log messages panel of QGIS
+        if (not self.isEnabled()):
+            return
+        lines = ['{}: {} x, {:.3f} s, max {:.3f} s'.format(name, count, total, maximum)
+                 for name, (count, total, maximum) in sorted(self.spans.items())]
+        lines += ['{}: {}'.format(name, value)
+                  for name, value in sorted(self.counters.items())]
+        QgsMessageLog.logMessage('\n'.join(lines), LOG_TAG, Qgis.Info)
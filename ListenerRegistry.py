@@ -0,0 +1,58 @@
+class ListenerRegistry:
+    """
+    Połączenia sygnałów wtyczki pogrupowane według id warstwy,
+    to samo połączenie nie jest dodawane ponownie
+    """
+
+    def __init__(self, onError=None):
+        # {owner key: {(signal, callback name): (object, signal, callback)}}
+        self.listeners = {}
+        self.onError = onError
+
+    def getListenerKey(self, signal, callback):
+        # bound signals are new objects on every access, their repr is not;
+        # closures created again for the same layer share the qualified name
+        return (repr(signal), getattr(callback, '__qualname__', repr(callback)))
+
+    def add(self, ownerKey, object, signal, callback):
+        listeners = self.listeners.setdefault(ownerKey, {})
+        listenerKey = self.getListenerKey(signal, callback)
+        if (listenerKey in listeners):
+            return False
+        signal.connect(callback)
+        listeners[listenerKey] = (object, signal, callback)
+        return True
+
+    def remove(self, ownerKey, signal, callback):
+        listeners = self.listeners.get(ownerKey)
+        if (listeners is None):
+            return False
+        listener = listeners.pop(self.getListenerKey(signal, callback), None)
+        if (len(listeners) == 0):
+            del self.listeners[ownerKey]
+        if (listener is None):
+            return False
+        self.disconnect(listener)
+        return True
+
+    def removeOwner(self, ownerKey):
+        for listener in self.listeners.pop(ownerKey, {}).values():
+            self.disconnect(listener)
+
+    def hasOwner(self, ownerKey):
+        return ownerKey in self.listeners
+
+    def disconnect(self, listener):
+        object, signal, callback = listener
+        try:
+            signal.disconnect(callback)
+        except Exception as ex:
+            if (self.onError is not None):
+                self.onError(ex, listener)
+
+    def clear(self):
+        for ownerKey in list(self.listeners.keys()):
+            self.removeOwner(ownerKey)
+
+    def count(self):
+        return sum(len(listeners) for listeners in self.listeners.values())
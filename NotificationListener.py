@@ -0,0 +1,100 @@
+from qgis.PyQt.QtCore import QSocketNotifier
+import json
+try:
+    import psycopg2
+    import psycopg2.extensions
+except ImportError:
+    psycopg2 = None
+
+
+NOTIFY_CHANNEL = 'editionreloader'
+NOTIFY_TRIGGER = 'editionreloader_notify'
+
+NOTIFY_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION public.editionreloader_notify() RETURNS trigger AS $$
+DECLARE
+    changed_row jsonb;
+BEGIN
+    IF (TG_OP = 'DELETE') THEN
+        changed_row := to_jsonb(OLD);
+    ELSE
+        changed_row := to_jsonb(NEW);
+    END IF;
+    PERFORM pg_notify('editionreloader', json_build_object(
+        'table', TG_TABLE_SCHEMA || '.' || TG_TABLE_NAME,
+        'fid', changed_row ->> TG_ARGV[0])::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def isAvailable():
+    return psycopg2 is not None
+
+
+class NotificationListener:
+    """
+    Nasłuchuje na dedykowanym połączeniu powiadomień NOTIFY
+    o zmianach obiektów tabeli w bazie PostgreSQL
+    """
+
+    def __init__(self, connectionInfo, schema, table, keyColumn, onNotify):
+        self.table = '{}.{}'.format(schema, table)
+        self.schema = schema
+        self.tableName = table
+        self.keyColumn = keyColumn
+        self.onNotify = onNotify
+        self.connection = psycopg2.connect(connectionInfo)
+        self.connection.set_isolation_level(
+            psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        self.notifier = None
+
+    def hasTrigger(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT 1 FROM pg_trigger WHERE tgname = %s AND tgrelid = %s::regclass',
+                (NOTIFY_TRIGGER, self.getQuotedTable()))
+            return cursor.fetchone() is not None
+
+    def installTrigger(self):
+        if (self.hasTrigger()):
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute(NOTIFY_FUNCTION_SQL)
+            cursor.execute(
+                'CREATE TRIGGER {} AFTER UPDATE OR DELETE ON {} FOR EACH ROW '
+                'EXECUTE PROCEDURE public.editionreloader_notify(%s)'.format(
+                    NOTIFY_TRIGGER, self.getQuotedTable()),
+                (self.keyColumn,))
+
+    def listen(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('LISTEN {}'.format(NOTIFY_CHANNEL))
+        self.notifier = QSocketNotifier(
+            self.connection.fileno(), QSocketNotifier.Read)
+        self.notifier.activated.connect(self._onActivated)
+
+    def close(self):
+        if (self.notifier is not None):
+            self.notifier.setEnabled(False)
+            self.notifier = None
+        if (not self.connection.closed):
+            self.connection.close()
+
+    def getQuotedTable(self):
+        return '"{}"."{}"'.format(self.schema.replace('"', '""'), self.tableName.replace('"', '""'))
+
+    def _onActivated(self):
+        self.connection.poll()
+        featureIds = set()
+        while (self.connection.notifies):
+            notify = self.connection.notifies.pop(0)
+            try:
+                payload = json.loads(notify.payload)
+                if (payload['table'] == self.table and payload['fid'] is not None):
+                    featureIds.add(int(payload['fid']))
+            except (ValueError, KeyError, TypeError):
+                continue
+        if (len(featureIds) > 0):
+            self.onNotify(featureIds)
@@ -0,0 +1,221 @@
+from qgis.core import QgsDataSourceUri, QgsFeature, QgsFeatureRequest, QgsGeometry, QgsProviderRegistry
+import hashlib
+import os
+import sqlite3
+
+
+def quoteIdentifier(identifier):
+    return '"{}"'.format(identifier.replace('"', '""'))
+
+
+class ProviderAdapter:
+    """
+    Odczyt obiektów warstwy zależny od dostawcy danych
+    """
+
+    providerName = None
+
+    def supportsLayer(self, layer):
+        return layer.dataProvider().name() == self.providerName
+
+    def getFeatures(self, layer, request):
+        return layer.dataProvider().getFeatures(request)
+
+    def createFeatureSource(self, layer):
+        # created in the main thread, read in worker threads
+        return layer.dataProvider().featureSource()
+
+    def getChangeToken(self, layer):
+        # cheap value changing with every write to the source,
+        # None if the source can not tell
+        return None
+
+    def getPrimaryKeyColumn(self, layer):
+        return None
+
+    def createTransactionIdReader(self, layer, pool=None):
+        # returns readTransactionIds(featureIds, chunkSize), which does not
+        # access the layer, so it can be called in a worker thread
+        return lambda featureIds=None, chunkSize=1000: {}
+
+    def getReadConnectionInfo(self, layer):
+        # connection of the read pool, None if the provider is read directly
+        return None
+
+    def createReadFeatureSource(self, layer, pool):
+        return None
+
+
+class PostgresAdapter(ProviderAdapter):
+    providerName = 'postgres'
+
+    def getPrimaryKeyColumn(self, layer):
+        # single integer primary key, which is then the postgres feature id
+        keyColumn = QgsDataSourceUri(layer.source()).keyColumn().strip('"')
+        if (not keyColumn or ',' in keyColumn):
+            return None
+        return keyColumn
+
+    def createTransactionIdReader(self, layer, pool=None):
+        # xmin is not exposed by the provider, so it is read with plain SQL
+        uri = QgsDataSourceUri(layer.source())
+        keyColumn = self.getPrimaryKeyColumn(layer)
+        if (keyColumn is None):
+            return super().createTransactionIdReader(layer, pool)
+        sql = 'SELECT {key}, xmin::text FROM {schema}.{table}'.format(
+            key=quoteIdentifier(keyColumn),
+            schema=quoteIdentifier(uri.schema() or 'public'),
+            table=quoteIdentifier(uri.table()))
+        if (pool is not None):
+            return lambda featureIds=None, chunkSize=1000: {
+                int(row[0]): row[1] for row in executeByIds(pool, sql, keyColumn, featureIds, chunkSize)}
+        connection = QgsProviderRegistry.instance().providerMetadata(
+            'postgres').createConnection(layer.source(), {})
+
+        def _readTransactionIds(featureIds=None, chunkSize=1000):
+            if (featureIds is None):
+                rows = connection.executeSql(sql)
+            else:
+                rows = []
+                featureIds = list(featureIds)
+                for start in range(0, len(featureIds), chunkSize):
+                    chunk = featureIds[start:start + chunkSize]
+                    rows += connection.executeSql('{} WHERE {} IN ({})'.format(
+                        sql, quoteIdentifier(keyColumn),
+                        ','.join(str(int(featureId)) for featureId in chunk)))
+            return {int(row[0]): row[1] for row in rows}
+        return _readTransactionIds
+
+    def getReadConnectionInfo(self, layer):
+        return QgsDataSourceUri(layer.source()).connectionInfo(True)
+
+    def createReadFeatureSource(self, layer, pool):
+        keyColumn = self.getPrimaryKeyColumn(layer)
+        if (keyColumn is None):
+            return None
+        return PooledFeatureSource(pool, layer, keyColumn)
+
+
+def getStatementName(sql):
+    return 'editionreloader_' + hashlib.md5(sql.encode('utf-8')).hexdigest()[:16]
+
+
+def executeByIds(pool, sql, keyColumn, featureIds=None, chunkSize=1000):
+    # rows of all features if featureIds is None
+    if (featureIds is None):
+        return pool.execute(getStatementName(sql), sql)
+    sql += ' WHERE {} = ANY($1)'.format(quoteIdentifier(keyColumn))
+    featureIds = list(featureIds)
+    rows = []
+    for start in range(0, len(featureIds), chunkSize):
+        rows += pool.execute(getStatementName(sql), sql,
+                             (featureIds[start:start + chunkSize],), ('bigint[]',))
+    return rows
+
+
+class PooledFeatureSource:
+    """
+    Odczyt obiektów tabeli PostgreSQL przez pulę połączeń,
+    zapytania filtrowane tylko po id obiektów
+    """
+
+    def __init__(self, pool, layer, keyColumn):
+        uri = QgsDataSourceUri(layer.source())
+        self.pool = pool
+        self.fields = layer.fields()
+        self.keyColumn = keyColumn
+        self.geometryColumn = uri.geometryColumn()
+        self.table = '{}.{}'.format(quoteIdentifier(uri.schema() or 'public'), quoteIdentifier(uri.table()))
+
+    def getFeatures(self, request):
+        hasGeometry = not (request.flags() & QgsFeatureRequest.NoGeometry)
+        if (request.flags() & QgsFeatureRequest.SubsetOfAttributes):
+            attributes = list(request.subsetOfAttributes())
+        else:
+            attributes = list(range(self.fields.count()))
+        columns = [quoteIdentifier(self.keyColumn)]
+        if (hasGeometry):
+            columns.append('ST_AsBinary({})'.format(quoteIdentifier(self.geometryColumn)))
+        columns += [quoteIdentifier(self.fields.at(index).name()) for index in attributes]
+        sql = 'SELECT {} FROM {}'.format(', '.join(columns), self.table)
+        featureIds = None
+        if (request.filterType() == QgsFeatureRequest.FilterFids):
+            featureIds = request.filterFids()
+        for row in executeByIds(self.pool, sql, self.keyColumn, featureIds, max(1, len(featureIds or ()))):
+            yield self.createFeature(row, hasGeometry, attributes)
+
+    def createFeature(self, row, hasGeometry, attributes):
+        feature = QgsFeature(self.fields, int(row[0]))
+        values = row[1:]
+        if (hasGeometry):
+            if (values[0] is not None):
+                geometry = QgsGeometry()
+                geometry.fromWkb(bytes(values[0]))
+                feature.setGeometry(geometry)
+            values = values[1:]
+        for index, value in zip(attributes, values):
+            feature.setAttribute(index, value)
+        return feature
+
+
+class FileAdapter(ProviderAdapter):
+    """
+    Dostawcy danych przechowujący warstwę w pliku SQLite,
+    zmiany wykrywane po czasie modyfikacji pliku
+    """
+
+    def getPath(self, layer):
+        return QgsDataSourceUri(layer.source()).database()
+
+    def getChangeToken(self, layer):
+        path = self.getPath(layer)
+        token = []
+        # changes of a database in WAL mode reach the main file only at checkpoint
+        for filePath in (path, path + '-wal'):
+            try:
+                token.append(os.stat(filePath).st_mtime_ns)
+            except OSError:
+                token.append(None)
+        return tuple(token)
+
+
+class OgrAdapter(FileAdapter):
+    providerName = 'ogr'
+
+    def supportsLayer(self, layer):
+        return (super().supportsLayer(layer) and layer.dataProvider().storageType() in ('GPKG', 'SQLite'))
+
+    def getPath(self, layer):
+        return QgsProviderRegistry.instance().decodeUri('ogr', layer.source())['path']
+
+    def getChangeToken(self, layer):
+        token = super().getChangeToken(layer)
+        if (layer.dataProvider().storageType() != 'GPKG'):
+            return token
+        uriParts = QgsProviderRegistry.instance().decodeUri('ogr', layer.source())
+        # last_change is updated by GDAL on every write to the table
+        sql = 'SELECT MAX(last_change) FROM gpkg_contents'
+        parameters = ()
+        if (uriParts.get('layerName')):
+            sql += ' WHERE table_name = ?'
+            parameters = (uriParts['layerName'],)
+        connection = sqlite3.connect(uriParts['path'], timeout=1)
+        try:
+            row = connection.execute(sql, parameters).fetchone()
+        finally:
+            connection.close()
+        return token + (row[0],)
+
+
+class SpatialiteAdapter(FileAdapter):
+    providerName = 'spatialite'
+
+
+ADAPTERS = [PostgresAdapter(), OgrAdapter(), SpatialiteAdapter()]
+
+
+def getProviderAdapter(layer):
+    for adapter in ADAPTERS:
+        if (adapter.supportsLayer(layer)):
+            return adapter
+    return None
@@ -0,0 +1,67 @@
+import threading
+try:
+    import psycopg2
+    import psycopg2.pool
+except ImportError:
+    psycopg2 = None
+
+
+def isAvailable():
+    return psycopg2 is not None
+
+
+class ReadConnectionPool:
+    """
+    Pula połączeń tylko do odczytu z bazą PostgreSQL używana przez kontrole,
+    niezależna od połączenia edytowanej warstwy
+    """
+
+    def __init__(self, connectionInfo, maxConnections, statementTimeout):
+        self.statementTimeout = statementTimeout  # ms
+        self.pool = psycopg2.pool.ThreadedConnectionPool(
+            1, maxConnections, connectionInfo)
+        # the pool raises an error instead of waiting for a free connection
+        self.semaphore = threading.BoundedSemaphore(maxConnections)
+        # {connection: names of statements prepared on the connection}
+        self.preparedStatements = {}
+
+    def getConnection(self):
+        connection = self.pool.getconn()
+        if (connection not in self.preparedStatements):
+            connection.set_session(readonly=True, autocommit=True)
+            with connection.cursor() as cursor:
+                cursor.execute('SET statement_timeout = %s',
+                               (int(self.statementTimeout),))
+            self.preparedStatements[connection] = set()
+        return connection
+
+    def execute(self, name, sql, parameters=(), parameterTypes=()):
+        # the statement is prepared once on every connection of the pool
+        with self.semaphore:
+            connection = self.getConnection()
+            isBroken = False
+            try:
+                with connection.cursor() as cursor:
+                    if (name not in self.preparedStatements[connection]):
+                        cursor.execute('PREPARE {}{} AS {}'.format(
+                            name, self.getParameterList(parameterTypes), sql))
+                        self.preparedStatements[connection].add(name)
+                    cursor.execute('EXECUTE {}{}'.format(
+                        name, self.getParameterList(['%s'] * len(parameters))), parameters)
+                    return cursor.fetchall()
+            except psycopg2.Error:
+                # a broken connection is closed and replaced by the pool
+                isBroken = True
+                self.preparedStatements.pop(connection, None)
+                raise
+            finally:
+                self.pool.putconn(connection, close=isBroken)
+
+    def getParameterList(self, parameters):
+        if (len(parameters) == 0):
+            return ''
+        return ' ({})'.format(', '.join(parameters))
+
+    def close(self):
+        self.preparedStatements.clear()
+        self.pool.closeall()
@@ -0,0 +1,41 @@
+import sqlite3
+
+
+class SnapshotCache:
+    """
+    Kopia geometrii obiektów warstw zapisana w pliku SQLite,
+    używana ponownie w kolejnych sesjach edycji
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS snapshot_features ('
+            'source TEXT NOT NULL, fid INTEGER NOT NULL, version TEXT, geometry BLOB, '
+            'PRIMARY KEY (source, fid))')
+
+    def getVersions(self, source):
+        rows = self.connection.execute(
+            'SELECT fid, version FROM snapshot_features WHERE source = ?', (source,))
+        return {featureId: version for featureId, version in rows}
+
+    def getGeometries(self, source):
+        # yields (featureId, wkb)
+        return self.connection.execute(
+            'SELECT fid, geometry FROM snapshot_features WHERE source = ?', (source,))
+
+    def setFeatures(self, source, features):
+        # features: iterable of (featureId, version, wkb)
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO snapshot_features (source, fid, version, geometry) VALUES (?, ?, ?, ?)',
+            ((source, featureId, version, wkb) for featureId, version, wkb in features))
+        self.connection.commit()
+
+    def removeFeatures(self, source, featureIds):
+        self.connection.executemany(
+            'DELETE FROM snapshot_features WHERE source = ? AND fid = ?',
+            ((source, featureId) for featureId in featureIds))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
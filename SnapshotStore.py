@@ -0,0 +1,438 @@
+from qgis.core import QgsFeature, QgsFeatureRequest, QgsGeometry, QgsRectangle
+from array import array
+import bisect
+import hashlib
+import heapq
+import math
+
+# features sorted at once when a snapshot index is built
+SORT_RUN_SIZE = 65536
+
+
+def findIndex(featureIds, featureId, featureCount=None):
+    # featureCount limits the search to the sorted part of featureIds
+    if (featureCount is None):
+        featureCount = len(featureIds)
+    index = bisect.bisect_left(featureIds, featureId, 0, featureCount)
+    if (index < featureCount and featureIds[index] == featureId):
+        return index
+    return None
+
+
+def getSorted(featureIds, *values):
+    # featureIds and the values at the same positions sorted by feature id,
+    # of a repeated feature id only the last one is kept, None if already sorted;
+    # sorted in runs merged afterwards, so temporary lists stay short
+    if (all(featureIds[index] < featureIds[index + 1] for index in range(len(featureIds) - 1))):
+        return None
+    runs = []
+    for start in range(0, len(featureIds), SORT_RUN_SIZE):
+        positions = range(start, min(start + SORT_RUN_SIZE, len(featureIds)))
+        runs.append(array('q', sorted(positions, key=featureIds.__getitem__)))
+    columns = (featureIds,) + values
+    sortedColumns = [array(column.typecode) for column in columns]
+    previousFeatureId = None
+    for position in heapq.merge(*runs, key=featureIds.__getitem__):
+        featureId = featureIds[position]
+        if (featureId == previousFeatureId):
+            for column, sortedColumn in zip(columns, sortedColumns):
+                sortedColumn[-1] = column[position]
+            continue
+        for column, sortedColumn in zip(columns, sortedColumns):
+            sortedColumn.append(column[position])
+        previousFeatureId = featureId
+    return sortedColumns
+
+
+class LayerSnapshot:
+    """
+    Kopia obiektów edytowanej warstwy
+    przechowywana w tymczasowej warstwie typu memory
+    """
+
+    def __init__(self, layer, featureIds):
+        self.layer = layer
+        # source feature id -> memory layer feature id
+        self.featureIds = featureIds
+
+    def hasFeature(self, featureId):
+        return featureId in self.featureIds
+
+    def hasGeometry(self, featureId):
+        return self.hasFeature(featureId)
+
+    def getGeometry(self, featureId):
+        if (featureId not in self.featureIds):
+            return None
+        return self.layer.getFeature(self.featureIds[featureId]).geometry()
+
+    def getGeometries(self, featureIds):
+        sourceFeatureIds = {self.featureIds[featureId]: featureId
+                            for featureId in featureIds if featureId in self.featureIds}
+        freq = QgsFeatureRequest()
+        freq.setFilterFids(list(sourceFeatureIds.keys()))
+        features = self.layer.dataProvider().getFeatures(freq)
+        return {sourceFeatureIds[feature.id()]: feature.geometry() for feature in features}
+
+    def setGeometry(self, featureId, geometry):
+        if (featureId in self.featureIds):
+            self.layer.dataProvider().changeGeometryValues(
+                {self.featureIds[featureId]: geometry})
+        else:
+            feature = QgsFeature()
+            feature.setGeometry(geometry)
+            result, addedFeatures = self.layer.dataProvider().addFeatures([
+                feature])
+            if (result):
+                self.featureIds[featureId] = addedFeatures[0].id()
+        self.layer.updateExtents()
+
+    def captureGeometry(self, featureId, geometry):
+        self.setGeometry(featureId, geometry)
+
+    def removeFeature(self, featureId):
+        if (featureId in self.featureIds):
+            self.layer.dataProvider().deleteFeatures(
+                [self.featureIds.pop(featureId)])
+
+    def featureCount(self):
+        return len(self.featureIds)
+
+
+class GeometrySnapshot:
+    """
+    Kopia geometrii obiektów edytowanej warstwy
+    przechowywana w słowniku id obiektu -> geometria
+    """
+
+    def __init__(self):
+        self.geometries = {}
+
+    def hasFeature(self, featureId):
+        return featureId in self.geometries
+
+    def hasGeometry(self, featureId):
+        return self.hasFeature(featureId)
+
+    def getGeometry(self, featureId):
+        return self.geometries.get(featureId)
+
+    def getGeometries(self, featureIds):
+        return {featureId: self.geometries[featureId]
+                for featureId in featureIds if featureId in self.geometries}
+
+    def setGeometry(self, featureId, geometry):
+        self.geometries[featureId] = geometry
+
+    def setGeometries(self, geometries, keepExisting=False):
+        # geometries: iterable of (featureId, geometry)
+        if (not keepExisting):
+            self.geometries.update(geometries)
+            return
+        for featureId, geometry in geometries:
+            self.geometries.setdefault(featureId, geometry)
+
+    def captureGeometry(self, featureId, geometry):
+        self.setGeometry(featureId, geometry)
+
+    def update(self, snapshot):
+        # features of the snapshot, captured while this one was built, replace these
+        self.geometries.update(snapshot.geometries)
+
+    def removeFeature(self, featureId):
+        self.geometries.pop(featureId, None)
+
+    def featureCount(self):
+        return len(self.geometries)
+
+
+class DigestSnapshot:
+    """
+    Skróty geometrii obiektów edytowanej warstwy w posortowanych tablicach,
+    pełna geometria przechowywana tylko dla obiektów edytowanych
+    """
+
+    def __init__(self):
+        # sorted feature ids with 64 bit digests of their geometries
+        self.featureIds = array('q')
+        self.digests = array('q')
+        self.geometries = {}
+
+    def getDigest(self, geometry):
+        digest = hashlib.blake2b(bytes(geometry.asWkb()), digest_size=8)
+        return int.from_bytes(digest.digest(), 'little', signed=True)
+
+    def getIndex(self, featureId, featureCount=None):
+        return findIndex(self.featureIds, featureId, featureCount)
+
+    def hasFeature(self, featureId):
+        return self.getIndex(featureId) is not None
+
+    def hasGeometry(self, featureId):
+        return featureId in self.geometries
+
+    def getGeometry(self, featureId):
+        return self.geometries.get(featureId)
+
+    def getGeometries(self, featureIds):
+        return {featureId: self.geometries[featureId] for featureId in featureIds
+                if self.geometries.get(featureId) is not None}
+
+    def matchesGeometry(self, featureId, geometry):
+        index = self.getIndex(featureId)
+        return index is not None and self.digests[index] == self.getDigest(geometry)
+
+    def setDigest(self, featureId, digest):
+        # single feature, inserted into the sorted index
+        index = bisect.bisect_left(self.featureIds, featureId)
+        if (index < len(self.featureIds) and self.featureIds[index] == featureId):
+            self.digests[index] = digest
+        else:
+            self.featureIds.insert(index, featureId)
+            self.digests.insert(index, digest)
+
+    def setDigests(self, digests, keepExisting=False):
+        # digests: iterable of (featureId, digest), new features are appended
+        # and the index is sorted once at the end
+        featureCount = len(self.featureIds)
+        for featureId, digest in digests:
+            index = self.getIndex(featureId, featureCount)
+            if (index is None):
+                self.featureIds.append(featureId)
+                self.digests.append(digest)
+            elif (not keepExisting):
+                self.digests[index] = digest
+        sortedColumns = getSorted(self.featureIds, self.digests)
+        if (sortedColumns is not None):
+            self.featureIds, self.digests = sortedColumns
+
+    def setGeometry(self, featureId, geometry):
+        self.setDigest(featureId, self.getDigest(geometry))
+        if (featureId in self.geometries):
+            self.geometries[featureId] = geometry
+
+    def setGeometries(self, geometries, keepExisting=False):
+        self.setDigests(self.getDigests(geometries, keepExisting), keepExisting)
+
+    def getDigests(self, geometries, keepExisting):
+        for featureId, geometry in geometries:
+            if (featureId in self.geometries and not keepExisting):
+                self.geometries[featureId] = geometry
+            yield (featureId, self.getDigest(geometry))
+
+    def captureGeometry(self, featureId, geometry):
+        # keep the geometry only if it is still the one from the snapshot,
+        # None marks a feature already changed in the database
+        if (not self.hasFeature(featureId)):
+            self.setDigest(featureId, self.getDigest(geometry))
+        if (self.matchesGeometry(featureId, geometry)):
+            self.geometries[featureId] = geometry
+        else:
+            self.geometries[featureId] = None
+
+    def update(self, snapshot):
+        # features of the snapshot, captured while this one was built, replace these
+        for featureId, digest in zip(snapshot.featureIds, snapshot.digests):
+            self.setDigest(featureId, digest)
+        self.geometries.update(snapshot.geometries)
+
+    def removeFeature(self, featureId):
+        self.geometries.pop(featureId, None)
+        index = self.getIndex(featureId)
+        if (index is not None):
+            del self.featureIds[index]
+            del self.digests[index]
+
+    def featureCount(self):
+        return len(self.featureIds)
+
+    def memoryUsage(self):
+        # bytes held by the index, geometries of edited features are not counted
+        return sum(len(values) * values.itemsize for values in (self.featureIds, self.digests))
+
+
+class WkbSnapshot:
+    """
+    Kopia geometrii obiektów edytowanej warstwy w postaci WKB
+    w jednym buforze, z posortowanym indeksem id obiektu -> położenie
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        # sorted feature ids with offset and length of their WKB in the buffer
+        self.featureIds = array('q')
+        self.offsets = array('Q')
+        self.lengths = array('Q')
+        # bytes of replaced or removed geometries still held in the buffer
+        self.unusedBytes = 0
+
+    def getIndex(self, featureId, featureCount=None):
+        return findIndex(self.featureIds, featureId, featureCount)
+
+    def hasFeature(self, featureId):
+        return self.getIndex(featureId) is not None
+
+    def hasGeometry(self, featureId):
+        return self.hasFeature(featureId)
+
+    def getWkb(self, featureId):
+        index = self.getIndex(featureId)
+        if (index is None):
+            return None
+        offset = self.offsets[index]
+        return bytes(self.buffer[offset:offset + self.lengths[index]])
+
+    def getGeometry(self, featureId):
+        geometryWkb = self.getWkb(featureId)
+        if (geometryWkb is None):
+            return None
+        geometry = QgsGeometry()
+        geometry.fromWkb(geometryWkb)
+        return geometry
+
+    def getGeometries(self, featureIds):
+        geometries = {}
+        for featureId in featureIds:
+            geometry = self.getGeometry(featureId)
+            if (geometry is not None):
+                geometries[featureId] = geometry
+        return geometries
+
+    def setWkb(self, featureId, geometryWkb):
+        # single feature, inserted into the sorted index,
+        # geometries are only appended, the buffer is compacted
+        # when more than half of it is unused
+        offset = len(self.buffer)
+        self.buffer += geometryWkb
+        index = bisect.bisect_left(self.featureIds, featureId)
+        if (index < len(self.featureIds) and self.featureIds[index] == featureId):
+            self.unusedBytes += self.lengths[index]
+            self.offsets[index] = offset
+            self.lengths[index] = len(geometryWkb)
+        else:
+            self.featureIds.insert(index, featureId)
+            self.offsets.insert(index, offset)
+            self.lengths.insert(index, len(geometryWkb))
+        self.compactIfNeeded()
+
+    def setWkbs(self, geometryWkbs, keepExisting=False):
+        # geometryWkbs: iterable of (featureId, wkb), data providers do not
+        # return features in fid order, so new features are appended
+        # and the index is sorted once at the end
+        featureCount = len(self.featureIds)
+        for featureId, geometryWkb in geometryWkbs:
+            index = self.getIndex(featureId, featureCount)
+            if (index is not None and keepExisting):
+                continue
+            if (index is None):
+                self.featureIds.append(featureId)
+                index = len(self.featureIds) - 1
+                self.offsets.append(0)
+                self.lengths.append(0)
+            else:
+                self.unusedBytes += self.lengths[index]
+            self.offsets[index] = len(self.buffer)
+            self.lengths[index] = len(geometryWkb)
+            self.buffer += geometryWkb
+        self.sortIndex()
+        self.compactIfNeeded()
+
+    def sortIndex(self):
+        sortedColumns = getSorted(self.featureIds, self.offsets, self.lengths)
+        if (sortedColumns is None):
+            return
+        # geometries of repeated feature ids are no longer referenced
+        self.unusedBytes += sum(self.lengths) - sum(sortedColumns[2])
+        self.featureIds, self.offsets, self.lengths = sortedColumns
+
+    def setGeometry(self, featureId, geometry):
+        self.setWkb(featureId, bytes(geometry.asWkb()))
+
+    def setGeometries(self, geometries, keepExisting=False):
+        self.setWkbs(((featureId, bytes(geometry.asWkb())) for featureId, geometry in geometries), keepExisting)
+
+    def captureGeometry(self, featureId, geometry):
+        self.setGeometry(featureId, geometry)
+
+    def update(self, snapshot):
+        # features of the snapshot, captured while this one was built, replace these
+        for featureId in snapshot.featureIds:
+            self.setWkb(featureId, snapshot.getWkb(featureId))
+
+    def removeFeature(self, featureId):
+        index = self.getIndex(featureId)
+        if (index is None):
+            return
+        self.unusedBytes += self.lengths[index]
+        del self.featureIds[index]
+        del self.offsets[index]
+        del self.lengths[index]
+        self.compactIfNeeded()
+
+    def compactIfNeeded(self):
+        if (self.unusedBytes * 2 <= len(self.buffer)):
+            return
+        buffer = bytearray()
+        for index in range(len(self.featureIds)):
+            offset = self.offsets[index]
+            self.offsets[index] = len(buffer)
+            buffer += self.buffer[offset:offset + self.lengths[index]]
+        self.buffer = buffer
+        self.unusedBytes = 0
+
+    def featureCount(self):
+        return len(self.featureIds)
+
+    def memoryUsage(self):
+        # bytes held by the buffer and the index
+        return (len(self.buffer) + sum(len(values) * values.itemsize
+                                       for values in (self.featureIds, self.offsets, self.lengths)))
+
+
+class TileCoverage:
+    """
+    Siatka kafli, dla których obiekty warstwy
+    zostały już skopiowane
+    """
+
+    def __init__(self, tileSize):
+        self.tileSize = tileSize
+        self.tiles = set()
+
+    def getMissingTiles(self, extent):
+        tiles = []
+        for column in range(math.floor(extent.xMinimum() / self.tileSize),
+                            math.floor(extent.xMaximum() / self.tileSize) + 1):
+            for row in range(math.floor(extent.yMinimum() / self.tileSize),
+                             math.floor(extent.yMaximum() / self.tileSize) + 1):
+                if ((column, row) not in self.tiles):
+                    tiles.append((column, row))
+        return tiles
+
+    def getTilesExtents(self, tiles):
+        # disjoint rectangles covering only the tiles: runs of tiles in a row
+        # joined with the same runs of the following rows, one request each
+        rowRuns = {}
+        for column, row in sorted(tiles, key=lambda tile: (tile[1], tile[0])):
+            runs = rowRuns.setdefault(row, [])
+            if (len(runs) > 0 and runs[-1][1] == column - 1):
+                runs[-1][1] = column
+            else:
+                runs.append([column, column])
+        rectangles = []
+        # {(first column, last column, last row): [first column, first row, last column, last row]}
+        openRectangles = {}
+        for row in sorted(rowRuns):
+            for firstColumn, lastColumn in rowRuns[row]:
+                rectangle = openRectangles.pop((firstColumn, lastColumn, row - 1), None)
+                if (rectangle is None):
+                    rectangle = [firstColumn, row, lastColumn, row]
+                    rectangles.append(rectangle)
+                rectangle[3] = row
+                openRectangles[(firstColumn, lastColumn, row)] = rectangle
+        return [QgsRectangle(firstColumn * self.tileSize, firstRow * self.tileSize,
+                             (lastColumn + 1) * self.tileSize, (lastRow + 1) * self.tileSize)
+                for firstColumn, firstRow, lastColumn, lastRow in rectangles]
+
+    def addTile(self, tile):
+        self.tiles.add(tile)
@@ -0,0 +1,44 @@
+from qgis.core import QgsTask
+
+
+class SnapshotTask(QgsTask):
+    """
+    Zadanie w tle tworzące kopię geometrii
+    obiektów edytowanej warstwy
+    """
+
+    def __init__(self, description, featureSource, featureCount, request, snapshot, onFinished,
+                 readVersions=None):
+        super().__init__(description, QgsTask.CanCancel)
+        # feature source has to be created in the main thread
+        self.featureSource = featureSource
+        self.featureCount = featureCount
+        self.request = request
+        self.snapshot = snapshot
+        self.onFinished = onFinished
+        # versions are read before the geometries, like in the main thread
+        self.readVersions = readVersions
+        self.versions = {}
+        self.exception = None
+
+    def run(self):
+        try:
+            if (self.readVersions is not None):
+                self.versions = self.readVersions()
+            self.snapshot.setGeometries(self.getGeometries())
+        except Exception as ex:
+            self.exception = ex
+            return False
+        return not self.isCanceled()
+
+    def getGeometries(self):
+        # the snapshot is built in one pass, stops when the task is canceled
+        for index, feature in enumerate(self.featureSource.getFeatures(self.request)):
+            if (self.isCanceled()):
+                return
+            yield (feature.id(), feature.geometry())
+            if (self.featureCount > 0 and index % 1000 == 0):
+                self.setProgress(100 * index / self.featureCount)
+
+    def finished(self, result):
+        self.onFinished(self, result)
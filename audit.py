@@ -0,0 +1,222 @@
+"""
+Headless audit of a layer against a reference snapshot in a GeoPackage,
+features changed, deleted or inserted since the snapshot are written
+to a GeoPackage layer.
+
+    python -m EditionReloader.audit --provider postgres --source "<uri>" \
+        --reference snapshot.gpkg --output diff.gpkg
+
+Feature ids of the reference layer are the source feature ids,
+unless --id-field names the attribute keeping them.
+"""
+from qgis.core import (QgsApplication, QgsCoordinateTransformContext, QgsFeature, QgsFeatureRequest,
+                       QgsField, QgsFields, QgsGeometry, QgsProviderRegistry, QgsVectorFileWriter, QgsVectorLayer)
+from qgis.PyQt.QtCore import QVariant
+import argparse
+import multiprocessing
+import os
+import sys
+from . import comparators
+from . import ProviderAdapters
+
+# layers opened once in every worker process
+workerLayers = {}
+
+
+def initQgis():
+    application = QgsApplication([], False)
+    application.initQgis()
+    return application
+
+
+def openLayers(arguments):
+    sourceLayer = QgsVectorLayer(arguments.source, 'source', arguments.provider)
+    referenceSource = arguments.reference
+    if (arguments.reference_layer):
+        referenceSource += '|layername=' + arguments.reference_layer
+    referenceLayer = QgsVectorLayer(referenceSource, 'reference', 'ogr')
+    for layer in (sourceLayer, referenceLayer):
+        if (not layer.isValid()):
+            raise ValueError('invalid layer: {}'.format(layer.source()))
+    return sourceLayer, referenceLayer
+
+
+def isInputLayer(arguments, layers):
+    # the output layer would replace a layer the differences are read from,
+    # a file opened without a layer name is taken as the output layer
+    for layer in layers:
+        parts = QgsProviderRegistry.instance().decodeUri(layer.providerType(), layer.source())
+        if (parts.get('path') and os.path.abspath(parts['path']) == os.path.abspath(arguments.output)
+                and parts.get('layerName') in (None, '', arguments.output_layer)):
+            return True
+    return False
+
+
+def initWorker(arguments):
+    workerLayers['application'] = initQgis()
+    workerLayers['source'], workerLayers['reference'] = openLayers(arguments)
+    workerLayers['arguments'] = arguments
+
+
+def createRequest(featureIds=None, idField=None, geometry=True):
+    freq = QgsFeatureRequest()
+    if (featureIds is not None):
+        freq.setFilterFids(list(featureIds))
+    if (idField is None):
+        freq.setNoAttributes()
+    else:
+        freq.setSubsetOfAttributes([idField], workerLayers['reference'].fields())
+    if (not geometry):
+        freq.setFlags(freq.flags() | QgsFeatureRequest.NoGeometry)
+    return freq
+
+
+def getSourceFeatures(layer, freq):
+    adapter = ProviderAdapters.getProviderAdapter(layer)
+    if (adapter is None):
+        return layer.dataProvider().getFeatures(freq)
+    return adapter.getFeatures(layer, freq)
+
+
+def getSourceIds(layer):
+    return [feature.id() for feature in getSourceFeatures(layer, createRequest(geometry=False))]
+
+
+def getReferenceIds(layer, idField):
+    # returns {source featureId: reference featureId}
+    if (idField is None):
+        return {feature.id(): feature.id()
+                for feature in layer.dataProvider().getFeatures(createRequest(geometry=False))}
+    return {feature.attribute(idField): feature.id()
+            for feature in layer.dataProvider().getFeatures(createRequest(idField=idField, geometry=False))}
+
+
+def getSourceWkbs(featureIds):
+    return {feature.id(): bytes(feature.geometry().asWkb())
+            for feature in getSourceFeatures(workerLayers['source'], createRequest(featureIds))}
+
+
+def getReferenceWkbs(featureIds):
+    # featureIds: {source featureId: reference featureId}
+    sourceIds = {referenceId: sourceId for sourceId, referenceId in featureIds.items()}
+    features = workerLayers['reference'].dataProvider().getFeatures(createRequest(sourceIds.keys()))
+    return {sourceIds[feature.id()]: bytes(feature.geometry().asWkb()) for feature in features}
+
+
+def toGeometry(geometryWkb):
+    geometry = QgsGeometry()
+    geometry.fromWkb(geometryWkb)
+    return geometry
+
+
+def auditChunk(featureIds):
+    # featureIds: {source featureId: reference featureId} present in both layers,
+    # returns [(featureId, 'changed', source wkb)]
+    tolerance = workerLayers['arguments'].tolerance
+    sourceWkbs = getSourceWkbs(featureIds.keys())
+    referenceWkbs = getReferenceWkbs(featureIds)
+    changes = []
+    for featureId in sorted(featureIds):
+        sourceWkb = sourceWkbs.get(featureId)
+        referenceWkb = referenceWkbs.get(featureId)
+        if (sourceWkb is None or referenceWkb is None):
+            continue
+        if (sourceWkb == referenceWkb):
+            continue
+        if (not comparators.compareGeometries(toGeometry(referenceWkb), toGeometry(sourceWkb), tolerance)):
+            changes.append((featureId, 'changed', sourceWkb))
+    return changes
+
+
+def auditMissing(featureIds, status):
+    # inserted features keep the source geometry, deleted the reference one
+    if (status == 'inserted'):
+        wkbs = getSourceWkbs(featureIds)
+    else:
+        wkbs = getReferenceWkbs(featureIds)
+    return [(featureId, status, wkbs.get(featureId, b'')) for featureId in sorted(featureIds)]
+
+
+def getChunks(featureIds, chunkSize):
+    featureIds = sorted(featureIds.items())
+    for start in range(0, len(featureIds), chunkSize):
+        yield dict(featureIds[start:start + chunkSize])
+
+
+def writeDifferences(arguments, sourceLayer, changes):
+    fields = QgsFields()
+    fields.append(QgsField('source_fid', QVariant.LongLong))
+    fields.append(QgsField('status', QVariant.String))
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = 'GPKG'
+    options.layerName = arguments.output_layer
+    # other layers of an existing GeoPackage are kept
+    options.actionOnExistingFile = QgsVectorFileWriter.CreateOrOverwriteLayer
+    writer = QgsVectorFileWriter.create(arguments.output, fields, sourceLayer.wkbType(), sourceLayer.crs(),
+                                        QgsCoordinateTransformContext(), options)
+    if (writer.hasError() != QgsVectorFileWriter.NoError):
+        raise IOError(writer.errorMessage())
+    for featureId, status, geometryWkb in changes:
+        feature = QgsFeature(fields)
+        feature.setAttributes([featureId, status])
+        if (geometryWkb):
+            feature.setGeometry(toGeometry(geometryWkb))
+        writer.addFeature(feature)
+    del writer
+
+
+def audit(arguments):
+    sourceLayer, referenceLayer = openLayers(arguments)
+    if (isInputLayer(arguments, (sourceLayer, referenceLayer))):
+        raise ValueError('output layer is an audited layer: {}|layername={}'.format(
+            arguments.output, arguments.output_layer))
+    workerLayers['source'], workerLayers['reference'] = sourceLayer, referenceLayer
+    workerLayers['arguments'] = arguments
+    sourceIds = set(getSourceIds(sourceLayer))
+    referenceIds = getReferenceIds(referenceLayer, arguments.id_field)
+    commonIds = {featureId: referenceId for featureId, referenceId in referenceIds.items()
+                 if featureId in sourceIds}
+    changes = auditMissing({featureId: featureId for featureId in sourceIds
+                            if featureId not in referenceIds}, 'inserted')
+    changes += auditMissing({featureId: referenceId for featureId, referenceId in referenceIds.items()
+                             if featureId not in sourceIds}, 'deleted')
+    # workers start QGIS on their own, spawn keeps it out of the forked state
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(arguments.workers, initWorker, (arguments,)) as pool:
+        for chunkChanges in pool.imap_unordered(auditChunk, getChunks(commonIds, arguments.chunk_size)):
+            changes += chunkChanges
+    changes.sort()
+    writeDifferences(arguments, sourceLayer, changes)
+    return changes
+
+
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--provider', default='postgres')
+    parser.add_argument('--source', required=True, help='data source uri of the audited layer')
+    parser.add_argument('--reference', required=True, help='GeoPackage with the reference snapshot')
+    parser.add_argument('--reference-layer', default=None)
+    parser.add_argument('--id-field', default=None,
+                        help='attribute of the reference layer keeping the source feature id')
+    parser.add_argument('--output', required=True, help='GeoPackage the differences are written to')
+    parser.add_argument('--output-layer', default='diff')
+    parser.add_argument('--tolerance', type=float, default=None)
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    arguments = parseArguments(argv)
+    application = initQgis()
+    try:
+        changes = audit(arguments)
+    finally:
+        application.exitQgis()
+    for status in ('changed', 'deleted', 'inserted'):
+        print('{}: {}'.format(status, sum(1 for change in changes if change[1] == status)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
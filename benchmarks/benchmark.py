@@ -0,0 +1,355 @@
+"""
+Benchmarks of the snapshot, check and commit paths of EditionResolver
+on synthetic polygon layers.
+
+    python benchmarks/benchmark.py --sizes 10000 100000 --output results.json
+
+Every scenario runs in its own process, so peak memory is not shared.
+With QGIS the layer is a GeoPackage read through the ogr provider,
+without QGIS the objects of qgisstub.py are used. Requests and features
+are counted by wrapping the provider adapters of the plugin.
+"""
+import argparse
+import importlib
+import itertools
+import json
+import math
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import qgisstub
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def importPluginModule(name):
+    # the plugin directory is a package with relative imports
+    if (os.path.dirname(ROOT) not in sys.path):
+        sys.path.insert(0, os.path.dirname(ROOT))
+    return importlib.import_module(os.path.basename(ROOT) + '.' + name)
+
+
+def importResolver():
+    return importPluginModule('EditionResolver').EditionResolver
+
+
+def initQgis():
+    # None if the stand-in is used
+    if (qgisstub.install()):
+        return None
+    from qgis.core import QgsApplication
+    application = QgsApplication([], False)
+    application.initQgis()
+    return application
+
+
+def getPeakMemory():
+    # kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def getMemory():
+    # resident memory in kB, None without /proc; the peak would hide
+    # the snapshot behind the memory used to build the layer
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize() // 1024
+    except OSError:
+        return None
+
+
+class CountingAdapter:
+    """
+    Provider adapter of the plugin counting the requests
+    and the features read through it
+    """
+
+    def __init__(self, adapter, counter):
+        self.adapter = adapter
+        self.counter = counter
+
+    def __getattr__(self, name):
+        return getattr(self.adapter, name)
+
+    def getFeatures(self, layer, request):
+        return self.counter.count(self.adapter.getFeatures(layer, request))
+
+    def createFeatureSource(self, layer):
+        return CountingFeatureSource(self.adapter.createFeatureSource(layer), self.counter)
+
+    def createReadFeatureSource(self, layer, pool):
+        featureSource = self.adapter.createReadFeatureSource(layer, pool)
+        if (featureSource is None):
+            return None
+        return CountingFeatureSource(featureSource, self.counter)
+
+
+class CountingFeatureSource:
+
+    def __init__(self, featureSource, counter):
+        self.featureSource = featureSource
+        self.counter = counter
+
+    def getFeatures(self, request):
+        return self.counter.count(self.featureSource.getFeatures(request))
+
+
+class Counter:
+
+    def __init__(self):
+        # checks read in worker threads
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requestCount = 0
+        self.featureCount = 0
+
+    def count(self, features):
+        with self.lock:
+            self.requestCount += 1
+        for feature in features:
+            with self.lock:
+                self.featureCount += 1
+            yield feature
+
+
+def installCounter():
+    ProviderAdapters = importPluginModule('ProviderAdapters')
+    counter = Counter()
+    ProviderAdapters.ADAPTERS[:] = [CountingAdapter(adapter, counter) for adapter in ProviderAdapters.ADAPTERS]
+    return counter
+
+
+def createFeatures(fields, size, vertexCount):
+    from qgis.core import QgsFeature, QgsGeometry, QgsPointXY
+    columns = max(1, int(size ** 0.5))
+    features = []
+    for index in range(size):
+        x = (index % columns) * 10.0
+        y = (index // columns) * 10.0
+        # regular polygon inscribed in a 10 x 10 cell
+        points = [QgsPointXY(x + 5 + 4 * cos, y + 5 + 4 * sin) for cos, sin in getUnitCircle(vertexCount)]
+        feature = QgsFeature()
+        feature.setGeometry(QgsGeometry.fromPolygonXY([points + points[:1]]))
+        feature.setFields(fields)
+        feature.setAttribute('version', 0)
+        features.append(feature)
+    return features
+
+
+def createLayer(size, vertexCount, directory):
+    from qgis.core import QgsField, QgsProject, QgsVectorLayer
+    if (qgisstub.isInstalled()):
+        layer = QgsVectorLayer('dbname=benchmark key="fid" table="public"."parcels" (geom)', 'parcels', 'postgres')
+        layer.dataProvider().addAttributes([QgsField('version')])
+        layer.dataProvider().addFeatures(createFeatures(layer.fields(), size, vertexCount))
+    else:
+        layer = createGeoPackageLayer(size, vertexCount, directory)
+    QgsProject.instance().addMapLayer(layer)
+    return layer
+
+
+def createGeoPackageLayer(size, vertexCount, directory):
+    from qgis.core import QgsCoordinateTransformContext, QgsVectorFileWriter, QgsVectorLayer
+    memoryLayer = QgsVectorLayer('Polygon?crs=EPSG:2180&field=version:integer', 'parcels', 'memory')
+    memoryLayer.dataProvider().addFeatures(createFeatures(memoryLayer.fields(), size, vertexCount))
+    path = os.path.join(directory, 'benchmark.gpkg')
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = 'GPKG'
+    options.layerName = 'parcels'
+    if (hasattr(QgsVectorFileWriter, 'writeAsVectorFormatV3')):
+        error = QgsVectorFileWriter.writeAsVectorFormatV3(memoryLayer, path, QgsCoordinateTransformContext(), options)
+    else:
+        error = QgsVectorFileWriter.writeAsVectorFormatV2(memoryLayer, path, QgsCoordinateTransformContext(), options)
+    if (error[0] != QgsVectorFileWriter.NoError):
+        raise IOError(error[1])
+    layer = QgsVectorLayer(path + '|layername=parcels', 'parcels', 'ogr')
+    if (not layer.isValid()):
+        raise IOError('invalid layer: ' + path)
+    return layer
+
+
+def getUnitCircle(vertexCount):
+    return [(math.cos(2 * math.pi * index / vertexCount), math.sin(2 * math.pi * index / vertexCount))
+            for index in range(vertexCount)]
+
+
+def getTranslatedGeometry(geometry, dx, dy):
+    from qgis.core import QgsGeometry
+    geometry = QgsGeometry(geometry)
+    geometry.translate(dx, dy)
+    return geometry
+
+
+def getFeatureIds(layer):
+    from qgis.core import QgsFeatureRequest
+    freq = QgsFeatureRequest().setNoAttributes()
+    freq.setFlags(QgsFeatureRequest.NoGeometry)
+    return sorted(feature.id() for feature in layer.dataProvider().getFeatures(freq))
+
+
+def changeInDatabase(layer, featureIds):
+    # another user commits these features, the data provider writes
+    # to the source past the edit buffer of the layer
+    from qgis.core import QgsFeatureRequest
+    provider = layer.dataProvider()
+    versionIndex = provider.fields().lookupField('version')
+    features = list(provider.getFeatures(QgsFeatureRequest().setFilterFids(list(featureIds))))
+    provider.changeGeometryValues({feature.id(): getTranslatedGeometry(feature.geometry(), 1, 0)
+                                   for feature in features})
+    provider.changeAttributeValues({feature.id(): {versionIndex: feature.attribute(versionIndex) + 1}
+                                    for feature in features})
+
+
+def measure(counter, function):
+    counter.reset()
+    start = time.perf_counter()
+    function()
+    return (time.perf_counter() - start, counter.requestCount, counter.featureCount)
+
+
+def runScenario(scenario, directory):
+    from qgis.core import Qgis, QgsRectangle
+    EditionResolver = importResolver()
+    counter = installCounter()
+    layer = createLayer(scenario['size'], scenario['vertices'], directory)
+    iface = qgisstub.Interface(QgsRectangle(0, 0, 1000, 1000))
+    resolver = EditionResolver(iface)
+    resolver._snapshotMode = scenario['mode']
+    resolver._snapshotStorage = scenario['storage']
+    resolver._versionColumn = scenario['versionColumn']
+    resolver._compareSimplifyTolerance = scenario['simplifyTolerance']
+    resolver._instrumentation = True
+    # every render is checked
+    resolver._checkInterval = 0
+    result = dict(scenario)
+    result['qgis'] = Qgis.QGIS_VERSION
+
+    baseMemory = getMemory()
+    result['editingStartedSeconds'], result['editingStartedRequests'], result['editingStartedFeatures'] = measure(
+        counter, layer.startEditing)
+    if (baseMemory is not None):
+        # resident memory added by the snapshot, C++ memory layers included
+        result['snapshotMemoryKb'] = getMemory() - baseMemory
+    snapshot = resolver.layers[layer]
+    if (hasattr(snapshot, 'memoryUsage')):
+        result['snapshotBytes'] = snapshot.memoryUsage()
+
+    featureIds = getFeatureIds(layer)
+    step = max(1, len(featureIds) // max(1, scenario['edits']))
+    editedFeatureIds = featureIds[::step][:scenario['edits']]
+    for featureId in editedFeatureIds:
+        layer.changeGeometry(featureId, getTranslatedGeometry(layer.getFeature(featureId).geometry(), 0, 1))
+    conflicts = editedFeatureIds[:scenario['conflicts']]
+    changeInDatabase(layer, conflicts)
+
+    def render():
+        iface.mapCanvas().render()
+        resolver.checkScheduler._onTimeout()
+
+    checks = [measure(counter, render) for index in range(scenario['renders'])]
+    result['conflictCheckSeconds'], result['conflictCheckRequests'], result['conflictCheckFeatures'] = checks[0]
+    if (len(checks) > 1):
+        result['renderCheckSeconds'] = statistics.median(check[0] for check in checks[1:])
+        result['renderCheckRequests'] = statistics.median(check[1] for check in checks[1:])
+        result['renderCheckFeatures'] = statistics.median(check[2] for check in checks[1:])
+
+    # the rolled back features are edited again before the commit
+    for featureId in conflicts:
+        layer.changeGeometry(featureId, getTranslatedGeometry(layer.getFeature(featureId).geometry(), 0, 1))
+    changeInDatabase(layer, editedFeatureIds[-scenario['conflicts']:] if scenario['conflicts'] else [])
+    result['commitSeconds'], result['commitRequests'], result['commitFeatures'] = measure(
+        counter, lambda: layer.commitChanges(False))
+
+    result['instrumentation'] = resolver.instrumentation.getReport()
+    result['checkCount'] = resolver.getCheckCount()
+    result['backupFeatures'] = sum(backupLayer.dataProvider().featureCount()
+                                   for backupLayer in resolver.backupLayers.values())
+    result['peakMemoryKb'] = getPeakMemory()
+    layer.rollBack()
+    return result
+
+
+def getScenarios(arguments):
+    for size, storage in itertools.product(arguments.sizes, arguments.storage):
+        yield {
+            'size': size,
+            'storage': storage,
+            'mode': arguments.mode,
+            'versionColumn': arguments.version_column,
+            'simplifyTolerance': arguments.simplify_tolerance,
+            'vertices': arguments.vertices,
+            'edits': arguments.edits,
+            'conflicts': min(arguments.conflicts, arguments.edits),
+            'renders': arguments.renders,
+        }
+
+
+def runScenarioProcess(scenario):
+    process = subprocess.run([sys.executable, os.path.abspath(__file__), '--scenario', json.dumps(scenario)],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if (process.returncode != 0):
+        return dict(scenario, error=process.stderr.strip().splitlines()[-1:])
+    return json.loads(process.stdout)
+
+
+def parseArguments():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--storage', nargs='+', default=['layer', 'geometry', 'digest', 'wkb'])
+    parser.add_argument('--mode', default='full', choices=['full', 'lazy', 'extent'])
+    parser.add_argument('--version-column', default=None,
+                        help="'version' compares the row versions before the geometries")
+    parser.add_argument('--simplify-tolerance', type=float, default=None)
+    parser.add_argument('--vertices', type=int, default=16)
+    parser.add_argument('--edits', type=int, default=100)
+    parser.add_argument('--conflicts', type=int, default=10)
+    parser.add_argument('--renders', type=int, default=5)
+    parser.add_argument('--output', help='JSON file, printed if not given')
+    parser.add_argument('--scenario', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    arguments = parseArguments()
+    if (arguments.scenario):
+        application = initQgis()
+        directory = tempfile.mkdtemp(prefix='editionreloader_benchmark_')
+        try:
+            print(json.dumps(runScenario(json.loads(arguments.scenario), directory)))
+            sys.stdout.flush()
+            if (application is not None):
+                application.exitQgis()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        return
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'commit': subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stdout=subprocess.PIPE,
+                                 stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip(),
+        'scenarios': [],
+    }
+    for scenario in getScenarios(arguments):
+        result = runScenarioProcess(scenario)
+        results['scenarios'].append(result)
+        print(json.dumps(result), file=sys.stderr)
+    output = json.dumps(results, indent=2)
+    if (arguments.output):
+        with open(arguments.output, 'w') as outputFile:
+            outputFile.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
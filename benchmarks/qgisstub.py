@@ -0,0 +1,749 @@
+"""
+Minimal stand-in of the qgis.core and qgis.PyQt.QtCore objects used by
+the resolver, so the benchmarks run without a QGIS installation.
+Geometries are single ring polygons kept as WKB.
+"""
+import itertools
+import re
+import struct
+import sys
+import tempfile
+import types
+
+
+class Signal:
+
+    def __init__(self):
+        self.callbacks = []
+
+    def connect(self, callback):
+        self.callbacks.append(callback)
+
+    def disconnect(self, callback):
+        self.callbacks.remove(callback)
+
+    def emit(self, *args):
+        for callback in list(self.callbacks):
+            callback(*args)
+
+
+class Qgis:
+    QGIS_VERSION = 'stub'
+    QGIS_VERSION_INT = 32800
+    Info = 0
+    Warning = 1
+    Critical = 2
+    Success = 3
+
+
+class QVariant:
+    Int = 2
+    String = 10
+
+
+class QTimer:
+    # never fires by itself, the benchmark calls the timeout directly
+
+    def __init__(self):
+        self.timeout = Signal()
+        self.active = False
+
+    def setSingleShot(self, singleShot):
+        pass
+
+    def start(self, interval=0):
+        self.active = True
+
+    def stop(self):
+        self.active = False
+
+    def isActive(self):
+        return self.active
+
+
+class QSocketNotifier:
+    Read = 0
+
+
+class QgsPointXY:
+
+    def __init__(self, x, y):
+        self._x = x
+        self._y = y
+
+    def x(self):
+        return self._x
+
+    def y(self):
+        return self._y
+
+
+class QgsRectangle:
+
+    def __init__(self, xMin=0.0, yMin=0.0, xMax=0.0, yMax=0.0):
+        self.values = (xMin, yMin, xMax, yMax)
+
+    def xMinimum(self):
+        return self.values[0]
+
+    def yMinimum(self):
+        return self.values[1]
+
+    def xMaximum(self):
+        return self.values[2]
+
+    def yMaximum(self):
+        return self.values[3]
+
+    def width(self):
+        return self.values[2] - self.values[0]
+
+    def height(self):
+        return self.values[3] - self.values[1]
+
+    def isEmpty(self):
+        return self.width() <= 0 or self.height() <= 0
+
+    def intersects(self, other):
+        return not (other.values[0] > self.values[2] or other.values[2] < self.values[0]
+                    or other.values[1] > self.values[3] or other.values[3] < self.values[1])
+
+    def intersect(self, other):
+        if (not self.intersects(other)):
+            return QgsRectangle()
+        return QgsRectangle(max(self.values[0], other.values[0]), max(self.values[1], other.values[1]),
+                            min(self.values[2], other.values[2]), min(self.values[3], other.values[3]))
+
+
+class QgsGeometry:
+
+    def __init__(self, other=None):
+        self.wkb = other.wkb if other is not None else b''
+
+    @staticmethod
+    def fromPolygonXY(rings):
+        return QgsGeometry.fromCoordinates([(point.x(), point.y()) for point in rings[0]])
+
+    @staticmethod
+    def fromCoordinates(coordinates):
+        geometry = QgsGeometry()
+        geometry.wkb = struct.pack('<BIII{}d'.format(2 * len(coordinates)), 1, 3, 1, len(coordinates),
+                                   *itertools.chain.from_iterable(coordinates))
+        return geometry
+
+    def fromWkb(self, wkb):
+        self.wkb = bytes(wkb)
+
+    def asWkb(self):
+        return self.wkb
+
+    def isEmpty(self):
+        return len(self.wkb) == 0
+
+    def coordinates(self):
+        if (self.isEmpty()):
+            return []
+        pointCount = struct.unpack_from('<I', self.wkb, 9)[0]
+        values = struct.unpack_from('<{}d'.format(2 * pointCount), self.wkb, 13)
+        return list(zip(values[0::2], values[1::2]))
+
+    def translate(self, dx, dy):
+        self.wkb = QgsGeometry.fromCoordinates([(x + dx, y + dy) for x, y in self.coordinates()]).wkb
+        return 0
+
+    def boundingBox(self):
+        coordinates = self.coordinates()
+        if (len(coordinates) == 0):
+            return QgsRectangle()
+        xs = [x for x, y in coordinates]
+        ys = [y for x, y in coordinates]
+        return QgsRectangle(min(xs), min(ys), max(xs), max(ys))
+
+    def constGet(self):
+        return self
+
+    def nCoordinates(self):
+        return len(self.coordinates())
+
+    def vertices(self):
+        return (QgsPointXY(x, y) for x, y in self.coordinates())
+
+    def equals(self, other):
+        return self.coordinates() == other.coordinates()
+
+    def convertToMultiType(self):
+        return True
+
+    def asWkt(self):
+        return 'Polygon (({}))'.format(', '.join('{} {}'.format(x, y) for x, y in self.coordinates()))
+
+
+class QgsField:
+
+    def __init__(self, name, type=None):
+        self._name = name
+        self._type = type
+
+    def name(self):
+        return self._name
+
+
+class QgsFields:
+
+    def __init__(self, fields=None):
+        self.fields = list(fields or [])
+
+    def append(self, field):
+        self.fields.append(field)
+
+    def lookupField(self, name):
+        for index, field in enumerate(self.fields):
+            if (field.name() == name):
+                return index
+        return -1
+
+    def indexOf(self, name):
+        return self.lookupField(name)
+
+    def count(self):
+        return len(self.fields)
+
+
+class QgsFeature:
+
+    def __init__(self, featureId=-1):
+        self._id = featureId
+        self._geometry = QgsGeometry()
+        self._fields = QgsFields()
+        self._attributes = []
+
+    def id(self):
+        return self._id
+
+    def setId(self, featureId):
+        self._id = featureId
+
+    def geometry(self):
+        return self._geometry
+
+    def setGeometry(self, geometry):
+        self._geometry = geometry
+
+    def hasGeometry(self):
+        return not self._geometry.isEmpty()
+
+    def fields(self):
+        return self._fields
+
+    def setFields(self, fields):
+        self._fields = fields
+        self._attributes = [None] * fields.count()
+
+    def attributes(self):
+        return self._attributes
+
+    def setAttributes(self, attributes):
+        self._attributes = list(attributes)
+
+    def getIndex(self, attribute):
+        if (isinstance(attribute, int)):
+            return attribute
+        return self._fields.lookupField(attribute)
+
+    def setAttribute(self, attribute, value):
+        self._attributes[self.getIndex(attribute)] = value
+
+    def attribute(self, attribute):
+        index = self.getIndex(attribute)
+        if (index < 0 or index >= len(self._attributes)):
+            return None
+        return self._attributes[index]
+
+
+class QgsSimplifyMethod:
+    NoSimplification = 0
+    OptimizeForRendering = 1
+
+    def setMethodType(self, methodType):
+        self.methodType = methodType
+
+    def setTolerance(self, tolerance):
+        self.tolerance = tolerance
+
+    def setForceLocalOptimization(self, localOptimization):
+        self.localOptimization = localOptimization
+
+
+class QgsFeatureRequest:
+    NoFlags = 0
+    NoGeometry = 1
+
+    def __init__(self):
+        self.featureIds = None
+        self.flagValues = QgsFeatureRequest.NoFlags
+        self.rectangle = None
+        self.simplifyMethod = None
+
+    def setFilterFids(self, featureIds):
+        self.featureIds = featureIds
+        return self
+
+    def setFilterRect(self, rectangle):
+        self.rectangle = rectangle
+        return self
+
+    def setNoAttributes(self):
+        return self
+
+    def setSubsetOfAttributes(self, attributes, fields=None):
+        return self
+
+    def flags(self):
+        return self.flagValues
+
+    def setFlags(self, flags):
+        self.flagValues = flags
+        return self
+
+    def setSimplifyMethod(self, simplifyMethod):
+        self.simplifyMethod = simplifyMethod
+        return self
+
+
+class QgsDataSourceUri:
+
+    def __init__(self, uri=''):
+        self.parameters = dict(re.findall(r'(\w+)=(\'[^\']*\'|"[^"]*"|\S+)', uri))
+
+    def get(self, name):
+        return self.parameters.get(name, '').strip('\'"')
+
+    def keyColumn(self):
+        return self.parameters.get('key', '')
+
+    def database(self):
+        return self.get('dbname')
+
+    def schema(self):
+        return self.get('schema')
+
+    def table(self):
+        return self.get('table')
+
+    def connectionInfo(self, expandAuthConfig=True):
+        return 'dbname={}'.format(self.database())
+
+
+class QgsProviderRegistry:
+    _instance = None
+
+    @staticmethod
+    def instance():
+        if (QgsProviderRegistry._instance is None):
+            QgsProviderRegistry._instance = QgsProviderRegistry()
+        return QgsProviderRegistry._instance
+
+    def decodeUri(self, providerKey, uri):
+        return {'path': uri.split('|')[0]}
+
+    def providerMetadata(self, providerKey):
+        raise RuntimeError('no provider metadata in the benchmark stub')
+
+
+class QgsTask:
+    CanCancel = 1
+
+    def __init__(self, description='', flags=0):
+        self.description = description
+        self.canceled = False
+
+    def isCanceled(self):
+        return self.canceled
+
+    def cancel(self):
+        self.canceled = True
+
+    def setProgress(self, progress):
+        pass
+
+
+class TaskManager:
+    # runs the task at once in the calling thread
+
+    def addTask(self, task):
+        task.finished(task.run())
+        return 1
+
+
+class QgsApplication:
+    _taskManager = TaskManager()
+
+    @staticmethod
+    def taskManager():
+        return QgsApplication._taskManager
+
+    @staticmethod
+    def qgisSettingsDirPath():
+        return tempfile.gettempdir()
+
+
+class QgsWkbTypes:
+    PointGeometry = 0
+    LineGeometry = 1
+    PolygonGeometry = 2
+
+    @staticmethod
+    def geometryDisplayString(geometryType):
+        return ('Point', 'Line', 'Polygon')[geometryType]
+
+
+class QgsCoordinateReferenceSystem:
+
+    def __init__(self, authid='EPSG:2180'):
+        self._authid = authid
+
+    def authid(self):
+        return self._authid
+
+
+class DataProvider:
+    """
+    Data provider keeping features in a dictionary
+    """
+
+    def __init__(self, providerName, fields=None, storageType='PostgreSQL database with PostGIS extension'):
+        self.providerName = providerName
+        self.storage = storageType
+        self.attributeFields = fields if fields is not None else QgsFields()
+        self.features = {}
+        # bounding boxes used by the rectangle filter
+        self.boxes = {}
+        self.nextFeatureId = 1
+
+    def name(self):
+        return self.providerName
+
+    def storageType(self):
+        return self.storage
+
+    def fields(self):
+        return self.attributeFields
+
+    def featureSource(self):
+        return self
+
+    def featureCount(self):
+        return len(self.features)
+
+    def getFeatures(self, request=None):
+        request = request or QgsFeatureRequest()
+        if (request.featureIds is None):
+            featureIds = self.features.keys()
+        else:
+            featureIds = sorted(featureId for featureId in request.featureIds
+                                if featureId in self.features)
+        hasGeometry = not (request.flags() & QgsFeatureRequest.NoGeometry)
+        return self.iterateFeatures(list(featureIds), request.rectangle, hasGeometry)
+
+    def iterateFeatures(self, featureIds, rectangle, hasGeometry):
+        for featureId in featureIds:
+            geometry, attributes = self.features[featureId]
+            if (rectangle is not None and not self.getBoundingBox(featureId).intersects(rectangle)):
+                continue
+            feature = QgsFeature(featureId)
+            feature._fields = self.attributeFields
+            feature._attributes = attributes
+            if (hasGeometry):
+                feature._geometry = geometry
+            yield feature
+
+    def getBoundingBox(self, featureId):
+        if (featureId not in self.boxes):
+            self.boxes[featureId] = self.features[featureId][0].boundingBox()
+        return self.boxes[featureId]
+
+    def extent(self):
+        boxes = [self.getBoundingBox(featureId) for featureId in self.features]
+        if (len(boxes) == 0):
+            return QgsRectangle()
+        return QgsRectangle(min(box.xMinimum() for box in boxes), min(box.yMinimum() for box in boxes),
+                            max(box.xMaximum() for box in boxes), max(box.yMaximum() for box in boxes))
+
+    def addFeatures(self, features):
+        for feature in features:
+            feature.setId(self.nextFeatureId)
+            self.nextFeatureId += 1
+            self.features[feature.id()] = (feature.geometry(), list(feature.attributes()))
+        return True, features
+
+    def changeGeometryValues(self, geometries):
+        for featureId, geometry in geometries.items():
+            if (featureId in self.features):
+                self.features[featureId] = (geometry, self.features[featureId][1])
+                self.boxes.pop(featureId, None)
+        return True
+
+    def changeAttributeValues(self, attributes):
+        for featureId, values in attributes.items():
+            for index, value in values.items():
+                self.features[featureId][1][index] = value
+        return True
+
+    def deleteFeatures(self, featureIds):
+        for featureId in featureIds:
+            self.features.pop(featureId, None)
+            self.boxes.pop(featureId, None)
+        return True
+
+    def addAttributes(self, fields):
+        for field in fields:
+            self.attributeFields.append(field)
+        return True
+
+    def reloadData(self):
+        pass
+
+
+class QgsVectorLayerEditBuffer:
+
+    def __init__(self):
+        self.geometries = {}
+
+    def changedGeometries(self):
+        return self.geometries
+
+    def changeGeometry(self, featureId, geometry):
+        self.geometries[featureId] = geometry
+        return True
+
+
+class QgsMapLayer:
+    layerIds = itertools.count(1)
+
+    def __init__(self, name):
+        self._name = name
+        self._id = '{}_{}'.format(name, next(QgsMapLayer.layerIds))
+        self.willBeDeleted = Signal()
+
+    def id(self):
+        return self._id
+
+    def name(self):
+        return self._name
+
+
+class QgsVectorLayer(QgsMapLayer):
+
+    def __init__(self, source='', name='', providerName='memory'):
+        super().__init__(name)
+        self._source = source
+        self.provider = DataProvider(providerName, QgsFields(), 'Memory storage')
+        self.buffer = None
+        self.layerExtent = None
+        for signal in ('editingStarted', 'editingStopped', 'beforeCommitChanges', 'afterCommitChanges',
+                       'committedGeometriesChanges', 'committedFeaturesAdded', 'committedFeaturesRemoved',
+                       'geometryChanged'):
+            setattr(self, signal, Signal())
+
+    def source(self):
+        return self._source
+
+    def dataProvider(self):
+        return self.provider
+
+    def sourceCrs(self):
+        return QgsCoordinateReferenceSystem()
+
+    def isSpatial(self):
+        return True
+
+    def geometryType(self):
+        return QgsWkbTypes.PolygonGeometry
+
+    def fields(self):
+        return self.provider.fields()
+
+    def extent(self):
+        if (self.layerExtent is None):
+            self.layerExtent = self.provider.extent()
+        return self.layerExtent
+
+    def updateExtents(self):
+        self.layerExtent = None
+
+    def updateFields(self):
+        pass
+
+    def triggerRepaint(self):
+        pass
+
+    def selectedFeatureIds(self):
+        return []
+
+    def getFeature(self, featureId):
+        feature = next(self.provider.getFeatures(QgsFeatureRequest().setFilterFids([featureId])), QgsFeature())
+        if (self.buffer is not None and featureId in self.buffer.geometries):
+            feature.setGeometry(self.buffer.geometries[featureId])
+        return feature
+
+    def editBuffer(self):
+        return self.buffer
+
+    def startEditing(self):
+        self.buffer = QgsVectorLayerEditBuffer()
+        self.editingStarted.emit()
+        return True
+
+    def changeGeometry(self, featureId, geometry):
+        self.buffer.changeGeometry(featureId, geometry)
+        self.geometryChanged.emit(featureId, geometry)
+        return True
+
+    def commitChanges(self, stopEditing=True):
+        self.beforeCommitChanges.emit()
+        geometries = dict(self.buffer.geometries)
+        self.provider.changeGeometryValues(geometries)
+        self.buffer.geometries.clear()
+        self.committedGeometriesChanges.emit(self.id(), geometries)
+        # like QGIS, the edit buffer is deleted before afterCommitChanges
+        if (stopEditing):
+            self.buffer = None
+        self.afterCommitChanges.emit()
+        if (stopEditing):
+            self.editingStopped.emit()
+        return True
+
+    def rollBack(self):
+        self.buffer = None
+        self.editingStopped.emit()
+        return True
+
+
+class QgsMessageLog:
+    messages = []
+
+    @staticmethod
+    def logMessage(message, tag='', level=Qgis.Info):
+        QgsMessageLog.messages.append((tag, message, level))
+
+
+class QgsProject:
+    _instance = None
+
+    def __init__(self):
+        self.layers = {}
+        self.layerWasAdded = Signal()
+        self.layerRemoved = Signal()
+        self.readProject = Signal()
+
+    @staticmethod
+    def instance():
+        if (QgsProject._instance is None):
+            QgsProject._instance = QgsProject()
+        return QgsProject._instance
+
+    def mapLayers(self):
+        return dict(self.layers)
+
+    def mapLayersByName(self, name):
+        return [layer for layer in self.layers.values() if layer.name() == name]
+
+    def addMapLayer(self, layer):
+        self.layers[layer.id()] = layer
+        self.layerWasAdded.emit(layer)
+        return layer
+
+
+class MapSettings:
+
+    def mapToLayerCoordinates(self, layer, extent):
+        return extent
+
+
+class MapCanvas:
+
+    def __init__(self, extent):
+        self.canvasExtent = extent
+        for signal in ('renderStarting', 'renderComplete', 'extentsChanged',
+                       'currentLayerChanged', 'mapCanvasRefreshed'):
+            setattr(self, signal, Signal())
+
+    def isDrawing(self):
+        return False
+
+    def extent(self):
+        return self.canvasExtent
+
+    def layers(self):
+        # the project of QGIS when it is importable, the stand-in otherwise
+        from qgis.core import QgsProject
+        return list(QgsProject.instance().mapLayers().values())
+
+    def mapSettings(self):
+        return MapSettings()
+
+    def render(self):
+        self.renderStarting.emit()
+        self.renderComplete.emit()
+        self.mapCanvasRefreshed.emit()
+
+
+class MessageBar:
+
+    def __init__(self):
+        self.messages = []
+
+    def pushMessage(self, title, text, level=0, duration=0):
+        self.messages.append((title, text, level))
+
+
+class Interface:
+
+    def __init__(self, extent=None):
+        self.canvas = MapCanvas(extent or QgsRectangle())
+        self.bar = MessageBar()
+
+    def mapCanvas(self):
+        return self.canvas
+
+    def messageBar(self):
+        return self.bar
+
+    def activeLayer(self):
+        return None
+
+
+installed = False
+
+
+def isInstalled():
+    return installed
+
+
+def install():
+    # registers the stand-in as the qgis package, unless QGIS is importable
+    global installed
+    try:
+        import qgis.core  # noqa: F401
+        return False
+    except ImportError:
+        pass
+    core = types.ModuleType('qgis.core')
+    for name in ('Qgis', 'QgsApplication', 'QgsCoordinateReferenceSystem', 'QgsDataSourceUri', 'QgsFeature',
+                 'QgsFeatureRequest', 'QgsField', 'QgsFields', 'QgsGeometry', 'QgsMapLayer', 'QgsMessageLog', 'QgsPointXY',
+                 'QgsProject', 'QgsProviderRegistry', 'QgsRectangle', 'QgsSimplifyMethod', 'QgsTask',
+                 'QgsVectorLayer', 'QgsVectorLayerEditBuffer', 'QgsWkbTypes'):
+        setattr(core, name, globals()[name])
+    qtCore = types.ModuleType('qgis.PyQt.QtCore')
+    for name in ('QSocketNotifier', 'QTimer', 'QVariant'):
+        setattr(qtCore, name, globals()[name])
+    pyQt = types.ModuleType('qgis.PyQt')
+    pyQt.QtCore = qtCore
+    package = types.ModuleType('qgis')
+    package.__path__ = []
+    package.core = core
+    package.PyQt = pyQt
+    sys.modules.update({'qgis': package, 'qgis.core': core,
+                        'qgis.PyQt': pyQt, 'qgis.PyQt.QtCore': qtCore})
+    installed = True
+    return True
@@ -0,0 +1,38 @@
+def getVertexCount(geometry):
+    return geometry.constGet().nCoordinates()
+
+
+def isBoundingBoxEqual(oldGeometry, newGeometry, tolerance=None):
+    oldBox = oldGeometry.boundingBox()
+    newBox = newGeometry.boundingBox()
+    oldValues = (oldBox.xMinimum(), oldBox.yMinimum(),
+                 oldBox.xMaximum(), oldBox.yMaximum())
+    newValues = (newBox.xMinimum(), newBox.yMinimum(),
+                 newBox.xMaximum(), newBox.yMaximum())
+    if (tolerance is None):
+        return oldValues == newValues
+    return all(abs(oldValue - newValue) <= tolerance for oldValue, newValue in zip(oldValues, newValues))
+
+
+def isVertexEqual(oldGeometry, newGeometry, tolerance):
+    # vertices are compared in order, geometries read back from
+    # the database keep the order of their vertices
+    for oldVertex, newVertex in zip(oldGeometry.vertices(), newGeometry.vertices()):
+        if (abs(oldVertex.x() - newVertex.x()) > tolerance or abs(oldVertex.y() - newVertex.y()) > tolerance):
+            return False
+    return True
+
+
+def compareGeometries(oldGeometry, newGeometry, tolerance=None):
+    # cheap tests first, topological equality only if they can not decide
+    if (oldGeometry.isEmpty() or newGeometry.isEmpty()):
+        return oldGeometry.isEmpty() == newGeometry.isEmpty()
+    if (not isBoundingBoxEqual(oldGeometry, newGeometry, tolerance)):
+        return False
+    if (getVertexCount(oldGeometry) != getVertexCount(newGeometry)):
+        return False
+    if (oldGeometry.asWkb() == newGeometry.asWkb()):
+        return True
+    if (tolerance is not None and isVertexEqual(oldGeometry, newGeometry, tolerance)):
+        return True
+    return oldGeometry.equals(newGeometry)
@@ -25,3 +25,33 @@ def temporary_control_layer_created(layer):
     message = 'Utworzono warstwę kontroli wersji obiektów dla warstwy: {}'.format(
         layer.name())
     return message
+
+
+def check_failed(error):
+    message = 'Nie udało się odczytać obiektów z bazy danych: {}. Edytowane obiekty nie zostały sprawdzone.'.format(
+        error)
+    return message
+
+
+def versions_read_failed(layer, error):
+    message = 'Nie udało się odczytać wersji obiektów warstwy: {}: {}. Obiekty będą kontrolowane przez porównanie geometrii.'.format(
+        layer.name(), error)
+    return message
+
+
+def snapshot_task_description(layer):
+    message = 'Tworzenie kopii obiektów warstwy: {}'.format(
+        layer.name())
+    return message
+
+
+def snapshot_task_failed(layer):
+    message = 'Nie udało się utworzyć kopii obiektów warstwy: {}. Kontrolowane będą tylko obiekty edytowane.'.format(
+        layer.name())
+    return message
+
+
+def push_mode_unavailable(layer):
+    message = 'Powiadomienia o zmianach z bazy danych są niedostępne dla warstwy: {}. Obiekty będą kontrolowane podczas odświeżania mapy.'.format(
+        layer.name())
+    return message
@@ -0,0 +1,51 @@
+from qgis.core import QgsGeometry
+import shapely
+from shapely import wkb
+
+
+def isVectorized():
+    # shapely 2 operates on whole arrays of geometries
+    return hasattr(shapely, 'from_wkb')
+
+
+def toWkb(geometries):
+    return [bytes(geometry.asWkb()) for geometry in geometries]
+
+
+def toGeometries(wkbs):
+    # a difference that failed is an empty geometry
+    geometries = []
+    for geometryWkb in wkbs:
+        geometry = QgsGeometry()
+        if (geometryWkb is not None):
+            geometry.fromWkb(geometryWkb)
+        geometries.append(geometry)
+    return geometries
+
+
+def getDifference(shapeWkb, otherShapeWkb):
+    # shapeWkb - otherShapeWkb, None if GEOS fails (e.g. on an invalid geometry)
+    try:
+        return (wkb.loads(shapeWkb) - wkb.loads(otherShapeWkb)).wkb
+    except Exception:
+        return None
+
+
+def getDifferences(oldGeometries, newGeometries):
+    # returns (cuts, expands): cut = new - old, expand = old - new
+    oldWkbs = toWkb(oldGeometries)
+    newWkbs = toWkb(newGeometries)
+    if (isVectorized()):
+        try:
+            oldShapes = shapely.from_wkb(oldWkbs)
+            newShapes = shapely.from_wkb(newWkbs)
+            cuts = shapely.to_wkb(shapely.difference(newShapes, oldShapes))
+            expands = shapely.to_wkb(shapely.difference(oldShapes, newShapes))
+            return (toGeometries(cuts), toGeometries(expands))
+        except Exception:
+            # a single invalid geometry fails the whole array,
+            # the others are computed one by one
+            pass
+    cuts = [getDifference(newWkb, oldWkb) for oldWkb, newWkb in zip(oldWkbs, newWkbs)]
+    expands = [getDifference(oldWkb, newWkb) for oldWkb, newWkb in zip(oldWkbs, newWkbs)]
+    return (toGeometries(cuts), toGeometries(expands))